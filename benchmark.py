@@ -0,0 +1,179 @@
+"""
+Benchmarks of the simulator and path planning hot paths
+
+Runs Robot.sense, Robot.move, Robot.spin and change_alpha_for_alpha on
+seeded worlds from init_simulation, and proff.astar and proff.tortusity on
+seeded random mazes of growing size. Prints (or writes with -o) a JSON
+report with the throughput, latency percentiles and peak memory of each
+case. With -b it compares against a previous report and exits with 1 when
+the median latency of some case got slower than the tolerance allows.
+
+    python benchmark.py -o baseline.json
+    python benchmark.py -b baseline.json
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import json
+import math
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import simulation
+import proff
+
+
+def measure(call, repeat):
+    """Times repeat calls of call(i), then runs it once more under tracemalloc."""
+    call(0)                     #warm up caches and lazy imports
+    latencies = []
+    for i in range(repeat):
+        t = time.perf_counter()
+        call(i)
+        latencies.append(time.perf_counter() - t)
+    tracemalloc.start()
+    call(0)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    latencies = np.array(latencies)
+    return {'calls': repeat,
+            'throughput': repeat/latencies.sum(),
+            'p50': float(np.percentile(latencies, 50)),
+            'p90': float(np.percentile(latencies, 90)),
+            'p99': float(np.percentile(latencies, 99)),
+            'peak_memory': peak}
+
+
+def world(obstacles, ambiente, seed):
+    """Headless robot in a world seeded with seed."""
+    return simulation.init_simulation(obstacles, ambiente, headless=True, seed=seed)
+
+
+def poses(seed, count):
+    rng = np.random.default_rng(seed)
+    return list(zip(rng.integers(10, simulation.display_cols-10, count).tolist(),
+                    rng.integers(10, simulation.display_rows-10, count).tolist(),
+                    rng.uniform(-360, 360, count).tolist()))
+
+
+def maze(size, seed, density=0.3):
+    """Random size x size maze of 0 (free) and 1 (wall) cells, with the top row
+    and the right column left free so that corner to corner paths exist."""
+    matrix = (np.random.default_rng(seed).random((size, size)) < density).astype(int)
+    matrix[0, :] = matrix[:, -1] = 0
+    return matrix
+
+
+def bench_robot(obstacles, ambiente, seed, repeat):
+    robot = world(obstacles, ambiente, seed)
+    robot.leave_trace = 0
+    places = poses(seed, repeat)
+    tag = 'obstacles=%d,ambiente=%d' % (obstacles, ambiente)
+
+    def place(i):
+        robot.rect.center = places[i][:2]
+        robot.azi = places[i][2]
+
+    def sense(i):
+        place(i)
+        robot.sense()
+
+    def move(i):
+        place(i)
+        ang = places[i][2]*math.pi/180
+        robot.move(-robot.fwd_speed*math.sin(ang), -robot.fwd_speed*math.cos(ang))
+
+    def spin(i):
+        robot.spin(simulation.r_step_theta)
+
+    results = {'sense[%s]' % tag: measure(sense, repeat),
+               'move[%s]' % tag: measure(move, repeat)}
+    robot.render = True
+    results['spin[%s]' % tag] = measure(spin, repeat)
+    return results
+
+
+def bench_alpha(repeat):
+    sprite = simulation.load_image('robo1.bmp', headless=True)
+    return {'change_alpha_for_alpha[%dx%d]' % sprite.get_size():
+            measure(lambda i: simulation.change_alpha_for_alpha(sprite.copy(), simulation.r_transparency), repeat)}
+
+
+def bench_maze(size, seed, repeat):
+    matrix = maze(size, seed)
+    return {'astar[%d]' % size: measure(lambda i: proff.astar(matrix, (0, 0), (size-1, size-1)), repeat),
+            'tortusity[%d]' % size: measure(lambda i: proff.tortusity(matrix), max(1, repeat//20))}
+
+
+def compare(results, baseline, tolerance):
+    """Returns the cases whose median latency grew more than tolerance."""
+    regressions = {}
+    for name, result in results.items():
+        if name in baseline and result['p50'] > baseline[name]['p50']*(1 + tolerance):
+            regressions[name] = {'p50': result['p50'], 'baseline_p50': baseline[name]['p50']}
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--obstacles', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--ambientes', type=int, nargs='+', default=[0, 1, 2])
+    parser.add_argument('--maze-sizes', type=int, nargs='+', default=[32, 64, 128])
+    parser.add_argument('--repeat', type=int, default=100, help='timed calls per case')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='write the report to this file')
+    parser.add_argument('-b', '--baseline', help='report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed slowdown of the median latency (0.2 is 20%%)')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for ambiente in args.ambientes:
+        #only the random world (ambiente 0) depends on the number of obstacles
+        for obstacles in (args.obstacles if ambiente == 0 else args.obstacles[:1]):
+            results.update(bench_robot(obstacles, ambiente, args.seed, args.repeat))
+    results.update(bench_alpha(args.repeat))
+    for size in args.maze_sizes:
+        results.update(bench_maze(size, args.seed, args.repeat))
+
+    report = {'meta': {'python': platform.python_version(),
+                       'numpy': np.__version__,
+                       'machine': platform.machine(),
+                       'seed': args.seed,
+                       'repeat': args.repeat},
+              'results': results}
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = compare(results, json.load(f)['results'], args.tolerance)
+        status = 1 if report['regressions'] else 0
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    for name, regression in report.get('regressions', {}).items():
+        print('REGRESSION %s: p50 %.3g s, baseline %.3g s' % (name, regression['p50'],
+              regression['baseline_p50']), file=sys.stderr)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
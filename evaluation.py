@@ -0,0 +1,187 @@
+"""
+Batch evaluation of robot controllers over many seeded worlds
+
+Runs a controller, a function called once per simulation cycle with the
+robot like robotica.start, over every seed and ambiente in a process pool.
+Time is counted in simulation cycles, not seconds, so results don't depend
+on the machine or its load. Prints (or writes with -o) a JSON report with
+the success rate, the cycles to reach the target and the path length, per
+ambiente and overall, and the result of every episode. --timeout also
+stops episodes after that many seconds, for controllers that may never
+return; those episodes are reported apart, since whether they happen does
+depend on the machine.
+
+    python evaluation.py robotica:start --seeds 20 --steps 2000
+    python evaluation.py mycontroller:step --ambientes 0 --workers 8 -o report.json
+    python evaluation.py mycontroller:step --timeout 60
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import importlib
+import json
+import math
+import os
+import random
+import signal
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import simulation
+
+
+class EpisodeTimeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise EpisodeTimeout()
+
+
+def _can_alarm():
+    return hasattr(signal, 'SIGALRM') and threading.current_thread() is threading.main_thread()
+
+
+def run_episode(controller, ambiente, seed, obstacles=10, steps=2000, timeout=None, cache_dir=None):
+    """Runs controller(robot) then robot.update() for up to steps cycles, in the
+    world of ambiente and seed, until the robot reaches the target.
+
+    random and np.random are seeded with seed first, for controllers that use
+    them. With timeout, episodes still running after that many seconds stop
+    and are marked as timed out; this needs SIGALRM, so where there is none
+    (not Unix, or not the main thread) the timeout is left out."""
+    #ambientes 1 and 2 are the same for every seed, they only need one world
+    world = simulation.cached_world(obstacles, ambiente, seed if ambiente == 0 else 0, cache_dir=cache_dir)
+    robot = simulation.init_simulation(headless=True, world=world)
+    random.seed(seed)
+    np.random.seed(seed)
+    result = {'ambiente': ambiente, 'seed': seed, 'reached': False, 'steps': 0,
+              'path_length': 0.0, 'collisions': 0, 'timeout': False}
+    x, y = robot.get_pos()
+    timeout = timeout if _can_alarm() else None
+    if timeout:
+        previous = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        for step in range(1, steps+1):
+            controller(robot)
+            robot.update()
+            result['steps'] = step
+            new_x, new_y = robot.get_pos()
+            result['path_length'] += math.hypot(new_x-x, new_y-y)
+            x, y = new_x, new_y
+            result['collisions'] += robot.get_collision()
+            if robot.target():
+                result['reached'] = True
+                break
+    except EpisodeTimeout:
+        result['timeout'] = True
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+    return result
+
+
+def _run_episode(episode, controller, options):
+    return run_episode(controller, *episode, **options)
+
+
+def statistics(results):
+    """Success rate, and the cycles to target and path lengths of the episodes
+    that reached it, as counts, means and percentiles. None where there are
+    no episodes to take them from, which keeps the report valid JSON.
+
+    Episodes stopped by the timeout are counted apart: the success rate is
+    that of the episodes that ran all their cycles or reached the target."""
+    reached = [r for r in results if r['reached']]
+    timeouts = sum(r['timeout'] for r in results)
+    finished = len(results) - timeouts
+    summary = {'episodes': len(results),
+               'reached': len(reached),
+               'failed': finished - len(reached),
+               'timeouts': timeouts,
+               'success_rate': len(reached)/finished if finished else None,
+               'collisions_mean': float(np.mean([r['collisions'] for r in results])) if results else None}
+    for key in ('steps', 'path_length'):
+        values = np.array([r[key] for r in reached], dtype=float)
+        summary[key] = {'mean': float(values.mean()), 'p50': float(np.percentile(values, 50)),
+                        'p90': float(np.percentile(values, 90))} if len(values) else None
+    return summary
+
+
+def evaluate(controller, seeds=range(10), ambientes=(0, 1, 2), obstacles=10, steps=2000,
+             timeout=None, workers=None, cache_dir=None):
+    """Runs controller over every seed of every ambiente, see run_episode, and
+    returns the statistics overall and per ambiente along with every result.
+
+    The episodes are spread over workers processes (None for one per core),
+    so controller must be a module level function; with workers=1 they run
+    in this process, one after the other."""
+    episodes = [(ambiente, seed) for ambiente in ambientes for seed in seeds]
+    options = {'obstacles': obstacles, 'steps': steps, 'timeout': timeout, 'cache_dir': cache_dir}
+    if workers == 1:
+        results = [_run_episode(episode, controller, options) for episode in episodes]
+    else:
+        #the worlds are written to the cache first, so that workers only read them
+        for ambiente in set(ambientes):
+            for seed in (seeds if ambiente == 0 else [0]):
+                simulation.cached_world(obstacles, ambiente, seed, cache_dir=cache_dir)
+        chunk = max(1, len(episodes)//(4*(workers or os.cpu_count())))
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(_run_episode, episodes, repeat(controller), repeat(options),
+                                    chunksize=chunk))
+    return {'overall': statistics(results),
+            'ambientes': {ambiente: statistics([r for r in results if r['ambiente'] == ambiente])
+                          for ambiente in ambientes},
+            'episodes': results}
+
+
+def load_controller(spec):
+    """Returns the function of a 'module:function' spec, like 'robotica:start'."""
+    module, _, name = spec.partition(':')
+    return getattr(importlib.import_module(module), name or 'start')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('controller', help="module:function called every cycle, e.g. robotica:start")
+    parser.add_argument('--seeds', type=int, default=10, help='worlds per ambiente, seeded 0..SEEDS-1')
+    parser.add_argument('--ambientes', type=int, nargs='+', default=[0, 1, 2])
+    parser.add_argument('--obstacles', type=int, default=10, help='random obstacles of ambiente 0')
+    parser.add_argument('--steps', type=int, default=2000, help='cycles before giving up')
+    parser.add_argument('--timeout', type=float, help='seconds before giving up on an episode, none by default')
+    parser.add_argument('--workers', type=int, help='processes, one per core by default')
+    parser.add_argument('--cache-dir', help='where worlds are cached, simulation.world_cache_dir by default')
+    parser.add_argument('-o', '--output', help='write the report to this file')
+    args = parser.parse_args(argv)
+
+    report = evaluate(load_controller(args.controller), range(args.seeds), args.ambientes,
+                      args.obstacles, args.steps, args.timeout, args.workers, args.cache_dir)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+Incremental path planning on occupancy grids
+
+A Planner keeps a D* Lite search (Koenig and Likhachev, 2002) between
+calls: when the start moves or cells of the grid change, only the part of
+the search they affect is repaired, instead of planning from scratch like
+proff.astar. Paths already found for the same grid, start and goal come
+from an LRU cache.
+
+    planner = Planner(simulation.occupancy_grid(4, 20))
+    ...every frame
+    planner.update(simulation.occupancy_grid(4, 20))
+    path = planner.plan(simulation.pixel_to_cell(x, y, 4), goal)
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import heapq
+import math
+from collections import OrderedDict
+
+import numpy as np
+from proff import neighbours
+
+
+class Planner():
+    """Shortest paths between cells of a grid of 0 (free) and nonzero
+    (blocked) cells, moving to the 8 adjacent cells at a cost of 1 per step,
+    as proff.astar does. Paths are lists of (row, col) from start to goal.
+
+    The planner works on its own copy of the grid; update gives it the new
+    grid and only the cells that differ are replanned. The search state is
+    kept for one goal at a time, a new goal starts a new search."""
+
+    def __init__(self, grid, cache_size=128):
+        self.grid       = np.array(grid, dtype=np.uint8) != 0
+        self.blocked    = self.grid.tolist()    #the same, but much faster to read cell by cell
+        self.rows, self.cols = self.grid.shape
+        self.grid_hash  = self._hash()
+        self.cache      = OrderedDict()     #(grid hash, start, goal) -> path
+        self.cache_size = cache_size
+        self.goal       = None
+        self.expanded   = 0                 #vertices expanded by the searches, for profiling
+
+    def _hash(self):
+        return hashlib.blake2b(np.packbits(self.grid).tobytes(), digest_size=16).digest()
+
+    def update(self, grid):
+        """Takes the new grid, of the same shape, and repairs the search around
+        the cells that changed. Returns the number of changed cells."""
+        blocked = np.asarray(grid) != 0
+        changed = np.argwhere(blocked != self.grid)
+        if len(changed) == 0:
+            return 0
+        self.grid = blocked.copy()
+        self.grid_hash = self._hash()
+        for row, col in changed.tolist():
+            self.blocked[row][col] = bool(blocked[row, col])
+        if self.goal is not None:
+            #the edges of a changed cell are those to its neighbours
+            for row, col in changed.tolist():
+                self._update_vertex((row, col))
+                for d_row, d_col in neighbours:
+                    other = (row + d_row, col + d_col)
+                    if self._inside(other):
+                        self._update_vertex(other)
+        return len(changed)
+
+    def plan(self, start, goal):
+        """Returns the shortest path from start to goal, None if there is none."""
+        start, goal = tuple(start), tuple(goal)
+        key = (self.grid_hash, start, goal)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            path = self.cache[key]
+            return list(path) if path is not None else None
+        if not (self._inside(start) and self._inside(goal)) or self.blocked[start[0]][start[1]] or self.blocked[goal[0]][goal[1]]:
+            path = None
+        else:
+            if goal != self.goal:
+                self._reset(start, goal)
+            elif start != self.start:
+                #D* Lite: keys already queued stay valid as lower bounds if km grows by the move
+                self.km += self._h(self.last, start)
+                self.last = start
+                self.start = start
+            self._compute_shortest_path()
+            path = self._extract_path()
+        self.cache[key] = path
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return list(path) if path is not None else None
+
+    def _inside(self, cell):
+        return 0 <= cell[0] < self.rows and 0 <= cell[1] < self.cols
+
+    def _h(self, a, b):
+        return max(abs(a[0] - b[0]), abs(a[1] - b[1]))
+
+    def _cost(self, a, b):
+        return math.inf if self.blocked[a[0]][a[1]] or self.blocked[b[0]][b[1]] else 1
+
+    def _successors(self, cell):
+        row, col = cell
+        for d_row, d_col in neighbours:
+            other = (row + d_row, col + d_col)
+            if 0 <= other[0] < self.rows and 0 <= other[1] < self.cols:
+                yield other
+
+    def _reset(self, start, goal):
+        self.start      = start
+        self.last       = start
+        self.goal       = goal
+        self.km         = 0
+        self.g          = {}                #missing entries are inf
+        self.rhs        = {goal: 0}
+        self.queued     = {}                #cell -> key it is queued with, stale heap entries are skipped
+        self.queue      = []
+        self._push(goal)
+
+    def _key(self, cell):
+        best = min(self.g.get(cell, math.inf), self.rhs.get(cell, math.inf))
+        return (best + self._h(self.start, cell) + self.km, best)
+
+    def _push(self, cell):
+        key = self._key(cell)
+        self.queued[cell] = key
+        heapq.heappush(self.queue, (key, cell))
+
+    def _update_vertex(self, cell):
+        if cell != self.goal:
+            self.rhs[cell] = min((self._cost(cell, other) + self.g.get(other, math.inf)
+                                  for other in self._successors(cell)), default=math.inf)
+        self._requeue(cell)
+
+    def _requeue(self, cell):
+        """Queues cell if it is inconsistent, with its current key."""
+        self.queued.pop(cell, None)
+        if self.g.get(cell, math.inf) != self.rhs.get(cell, math.inf):
+            self._push(cell)
+
+    def _compute_shortest_path(self):
+        queue, queued, g, rhs = self.queue, self.queued, self.g, self.rhs
+        start, goal, blocked = self.start, self.goal, self.blocked
+        while queue:
+            key, cell = queue[0]
+            if queued.get(cell) != key:
+                heapq.heappop(queue)
+                continue
+            if key >= self._key(start) and rhs.get(start, math.inf) == g.get(start, math.inf):
+                break
+            new_key = self._key(cell)
+            if key < new_key:
+                self._push(cell)
+                continue
+            heapq.heappop(queue)
+            del queued[cell]
+            self.expanded += 1
+            # The optimized D* Lite: neighbours only look again at all their
+            # successors when cell was the one giving them their rhs
+            if g.get(cell, math.inf) > rhs[cell]:
+                g[cell] = rhs[cell]
+                through = g[cell] + 1
+                for other in self._successors(cell):
+                    if other != goal and not blocked[other[0]][other[1]] and through < rhs.get(other, math.inf):
+                        rhs[other] = through
+                        self._requeue(other)
+            else:
+                through = g[cell] + 1
+                g[cell] = math.inf
+                self._update_vertex(cell)
+                for other in self._successors(cell):
+                    if other != goal and not blocked[other[0]][other[1]] and rhs.get(other, math.inf) == through:
+                        self._update_vertex(other)
+
+    def _extract_path(self):
+        """Follows the lowest g from the start, which leads to the goal."""
+        g, blocked = self.g, self.blocked
+        if g.get(self.start, math.inf) == math.inf:
+            return None
+        path = [self.start]
+        row, col = self.start
+        while (row, col) != self.goal:
+            best = math.inf
+            for d_row, d_col in neighbours:
+                other = (row + d_row, col + d_col)
+                if 0 <= other[0] < self.rows and 0 <= other[1] < self.cols and not blocked[other[0]][other[1]]:
+                    other_g = g.get(other, math.inf)
+                    if other_g < best:
+                        best, cell = other_g, other
+            row, col = cell
+            path.append(cell)
+        return path
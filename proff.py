@@ -1,116 +1,295 @@
-import cv2
 import numpy as np
-
-img_path = 'test.png'
-img = cv2.imread(img_path, 0)
-matrix=np.logical_not(img)
-matrix1=np.array(matrix,dtype=int)
-
-import numpy as np
-import porespy as ps
-import matplotlib.pyplot as plt
-import time 
-class Node():
-    """A node class for A* Pathfinding"""
-
-    def __init__(self, parent=None, position=None):
-        self.parent = parent
-        self.position = position
-
-        self.g = 0
-        self.h = 0
-        self.f = 0
-
-    def __eq__(self, other):
-        return self.position == other.position
-
-
-def astar(maze, start, end):
-    """Returns a list of tuples as a path from the given start to the given end in the given maze"""
-
-    # Create start and end node
-    start_node = Node(None, start)
-    start_node.g = start_node.h = start_node.f = 0
-    end_node = Node(None, end)
-    end_node.g = end_node.h = end_node.f = 0
-
-    # Initialize both open and closed list
-    open_list = []
-    closed_list = []
-
-    # Add the start node
-    open_list.append(start_node)
+import os
+import math
+import heapq
+from array import array
+from itertools import repeat
+
+# Importing this module only defines functions: OpenCV is imported by
+# load_maze, and the process pool modules by a parallel tortusity
+
+
+def load_maze(img_path='test.png'):
+    """Reads the image at img_path as a maze of 0 (white, pore) and 1 (dark,
+    solid) cells, one byte each."""
+    import cv2
+    img = cv2.imread(img_path, 0)
+    if img is None:
+        raise FileNotFoundError('could not read image %r' % (img_path,))
+    return np.logical_not(img).view(np.uint8)      #same 0/1 cells, no copy
+
+#the 8 adjacent squares, every step costs 1
+neighbours = [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+
+def astar(maze, start, end, backend='astar'):
+    """Returns a list of tuples as a path from the given start to the given end in the given maze
+
+    backend picks the planner: 'astar' counts every step as 1 and returns
+    every cell of the path; 'jps' is Jump Point Search, with diagonal steps
+    costing sqrt(2), and also returns every cell; 'theta' is Lazy Theta*, which
+    goes straight between cells in line of sight and returns only the
+    turning points of the path."""
+    return planners[backend](maze, start, end)
+
+
+def _grid_astar(maze, start, end):
+    maze = np.asarray(maze)
+    rows, cols = maze.shape
+    blocked = np.ascontiguousarray(maze != 0, dtype=np.uint8).tobytes()
+    end_row, end_col = end
+    start_index = start[0]*cols + start[1]
+    end_index = end_row*cols + end_col
+
+    # Cells are numbered row by row: g value, parent and closed flag of each one
+    g = array('l', [-1])*(rows*cols)
+    parent = array('l', [-1])*(rows*cols)
+    closed = bytearray(rows*cols)
+
+    # The open list is a heap of (f, h, cell); h breaks ties towards the end.
+    # The heuristic is the chebyshev distance, which never overestimates as
+    # diagonal steps cost 1 too, so the first time the end is popped it is optimal
+    h = max(abs(start[0] - end_row), abs(start[1] - end_col))
+    g[start_index] = 0
+    open_heap = [(h, h, start_index)]
 
     # Loop until you find the end
-    while len(open_list) > 0:
-
-        # Get the current node
-        current_node = open_list[0]
-        current_index = 0
-        for index, item in enumerate(open_list):
-            if item.f < current_node.f:
-                current_node = item
-                current_index = index
-
-        # Pop current off open list, add to closed list
-        open_list.pop(current_index)
-        closed_list.append(current_node)
+    while open_heap:
+        f, h, current = heapq.heappop(open_heap)
+        if closed[current]:
+            continue            # stale entry, the cell was already expanded with a lower g
+        closed[current] = 1
 
         # Found the goal
-        if current_node == end_node:
+        if current == end_index:
             path = []
-            current = current_node
-            while current is not None:
-                path.append(current.position)
-                current = current.parent
+            while current != -1:
+                path.append(divmod(current, cols))
+                current = parent[current]
             return path[::-1] # Return reversed path
 
-        # Generate children
-        children = []
-        for new_position in [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1)]: # Adjacent squares
-
-            # Get node position
-            node_position = (current_node.position[0] + new_position[0], current_node.position[1] + new_position[1])
+        # Relax the adjacent squares
+        row, col = divmod(current, cols)
+        child_g = g[current] + 1
+        for d_row, d_col in neighbours:
+            child_row = row + d_row
+            child_col = col + d_col
 
             # Make sure within range
-            if node_position[0] > (len(maze) - 1) or node_position[0] < 0 or node_position[1] > (len(maze[len(maze)-1]) -1) or node_position[1] < 0:
+            if child_row < 0 or child_row >= rows or child_col < 0 or child_col >= cols:
                 continue
 
-            # Make sure walkable terrain
-            if maze[node_position[0]][node_position[1]] != 0:
+            # Make sure walkable terrain that was not expanded yet
+            child = child_row*cols + child_col
+            if blocked[child] or closed[child]:
                 continue
 
-            # Create new node
-            new_node = Node(current_node, node_position)
-
-            # Append
-            children.append(new_node)
-
-        # Loop through children
-        for child in children:
-
-            # Child is on the closed list
-            for closed_child in closed_list:
-                if child == closed_child:
-                    continue
-
-            # Create the f, g, and h values
-            child.g = current_node.g + 1
-            child.h = ((child.position[0] - end_node.position[0]) ** 2) + ((child.position[1] - end_node.position[1]) ** 2)
-            child.f = child.g + child.h
-
-            # Child is already in the open list
-            for open_node in open_list:
-                if child == open_node and child.g > open_node.g:
-                    continue
+            # Keep only the best way found so far to the child
+            if g[child] != -1 and g[child] <= child_g:
+                continue
+            g[child] = child_g
+            parent[child] = current
+            h = max(abs(child_row - end_row), abs(child_col - end_col))
+            heapq.heappush(open_heap, (child_g + h, h, child))
+
+    return None
+
+
+
+SQRT2 = math.sqrt(2)
+
+
+def _octile(d_row, d_col):
+    d_row, d_col = abs(d_row), abs(d_col)
+    return max(d_row, d_col) + (SQRT2 - 1)*min(d_row, d_col)
+
+
+def _jump_point_search(maze, start, end):
+    maze = np.asarray(maze)
+    rows, cols = maze.shape
+    blocked = np.ascontiguousarray(maze != 0, dtype=np.uint8).tobytes()
+    #plain ints, the sign of numpy ints below wouldn't be a step
+    start, end = tuple(map(int, start)), tuple(map(int, end))
+
+    def walkable(row, col):
+        return 0 <= row < rows and 0 <= col < cols and not blocked[row*cols + col]
+
+    def jump(row, col, d_row, d_col):
+        """Next jump point from (row, col) going (d_row, d_col), None if none."""
+        while True:
+            row += d_row
+            col += d_col
+            if not walkable(row, col):
+                return None
+            if (row, col) == end:
+                return row, col
+            if d_row and d_col:
+                # Forced neighbours around a diagonal step, or a jump point straight ahead
+                if ((not walkable(row - d_row, col) and walkable(row - d_row, col + d_col)) or
+                        (not walkable(row, col - d_col) and walkable(row + d_row, col - d_col))):
+                    return row, col
+                if jump(row, col, d_row, 0) or jump(row, col, 0, d_col):
+                    return row, col
+            elif d_row:
+                if ((not walkable(row, col + 1) and walkable(row + d_row, col + 1)) or
+                        (not walkable(row, col - 1) and walkable(row + d_row, col - 1))):
+                    return row, col
+            else:
+                if ((not walkable(row + 1, col) and walkable(row + 1, col + d_col)) or
+                        (not walkable(row - 1, col) and walkable(row - 1, col + d_col))):
+                    return row, col
+
+    def directions(node, parent):
+        """Natural and forced neighbour directions of node reached from parent."""
+        if parent is None:
+            return neighbours
+        row, col = node
+        d_row = (row > parent[0]) - (row < parent[0])
+        d_col = (col > parent[1]) - (col < parent[1])
+        if d_row and d_col:
+            result = [(d_row, 0), (0, d_col), (d_row, d_col)]
+            if not walkable(row - d_row, col):
+                result.append((-d_row, d_col))
+            if not walkable(row, col - d_col):
+                result.append((d_row, -d_col))
+        elif d_row:
+            result = [(d_row, 0)]
+            if not walkable(row, col + 1):
+                result.append((d_row, 1))
+            if not walkable(row, col - 1):
+                result.append((d_row, -1))
+        else:
+            result = [(0, d_col)]
+            if not walkable(row + 1, col):
+                result.append((1, d_col))
+            if not walkable(row - 1, col):
+                result.append((-1, d_col))
+        return result
+
+    # Only jump points enter the open list, so g and parent are sparse
+    g = {start: 0.0}
+    parent = {start: None}
+    closed = set()
+    h = _octile(start[0] - end[0], start[1] - end[1])
+    open_heap = [(h, h, start)]
+    while open_heap:
+        f, h, current = heapq.heappop(open_heap)
+        if current in closed:
+            continue
+        closed.add(current)
+        if current == end:
+            # Fill in the straight or diagonal runs between jump points
+            path = [current]
+            while parent[current] is not None:
+                previous = parent[current]
+                d_row = (previous[0] > current[0]) - (previous[0] < current[0])
+                d_col = (previous[1] > current[1]) - (previous[1] < current[1])
+                while current != previous:
+                    current = (current[0] + d_row, current[1] + d_col)
+                    path.append(current)
+            return path[::-1]
+        for d_row, d_col in directions(current, parent[current]):
+            point = jump(current[0], current[1], d_row, d_col)
+            if point is None or point in closed:
+                continue
+            point_g = g[current] + _octile(point[0] - current[0], point[1] - current[1])
+            if point in g and g[point] <= point_g:
+                continue
+            g[point] = point_g
+            parent[point] = current
+            h = _octile(point[0] - end[0], point[1] - end[1])
+            heapq.heappush(open_heap, (point_g + h, h, point))
+    return None
+
+
+def line_of_sight(maze, start, end):
+    """True if the segment between the centers of the start and end cells only
+    crosses free cells; through a corner, both cells beside it must be free."""
+    (row, col), (end_row, end_col) = map(int, start), map(int, end)
+    n_row, n_col = abs(end_row - row), abs(end_col - col)
+    s_row, s_col = (end_row > row) - (end_row < row), (end_col > col) - (end_col < col)
+    i_row = i_col = 0
+    while i_row < n_row or i_col < n_col:
+        # Which cell border comes first: (0.5+i_col)/n_col against (0.5+i_row)/n_row
+        decision = (1 + 2*i_col)*n_row - (1 + 2*i_row)*n_col
+        if decision == 0:
+            if maze[row + s_row][col] != 0 or maze[row][col + s_col] != 0:
+                return False
+            row += s_row
+            col += s_col
+            i_row += 1
+            i_col += 1
+        elif decision < 0:
+            col += s_col
+            i_col += 1
+        else:
+            row += s_row
+            i_row += 1
+        if maze[row][col] != 0:
+            return False
+    return True
+
+
+def _theta_star(maze, start, end):
+    maze = np.asarray(maze)
+    rows, cols = maze.shape
+    maze = maze.tolist()        #line_of_sight indexes cell by cell, much faster on lists
+    start, end = tuple(map(int, start)), tuple(map(int, end))
+
+    def distance(a, b):
+        return math.hypot(a[0] - b[0], a[1] - b[1])
+
+    # Lazy Theta*: children get the grandparent as parent on trust, and the line
+    # of sight is only checked once, when the child is expanded
+    g = {start: 0.0}
+    parent = {start: start}
+    closed = set()
+    open_heap = [(distance(start, end), start)]
+    while open_heap:
+        f, current = heapq.heappop(open_heap)
+        if current in closed:
+            continue
+        closed.add(current)
+        via = parent[current]
+        # Grid neighbours always see each other, corners cut as in the other planners
+        if max(abs(via[0] - current[0]), abs(via[1] - current[1])) > 1 and not line_of_sight(maze, via, current):
+            # Fall back to the best expanded grid neighbour
+            g[current] = math.inf
+            for d_row, d_col in neighbours:
+                other = (current[0] + d_row, current[1] + d_col)
+                if other in closed and other != current:
+                    other_g = g[other] + distance(other, current)
+                    if other_g < g[current]:
+                        g[current], parent[current] = other_g, other
+            # Queued on a key that was too low, so wait for its real turn
+            closed.discard(current)
+            heapq.heappush(open_heap, (g[current] + distance(current, end), current))
+            continue
+        if current == end:
+            path = [current]
+            while parent[current] != current:
+                current = parent[current]
+                path.append(current)
+            return path[::-1]
+        via = parent[current]
+        for d_row, d_col in neighbours:
+            child = (current[0] + d_row, current[1] + d_col)
+            if not (0 <= child[0] < rows and 0 <= child[1] < cols) or maze[child[0]][child[1]] != 0 or child in closed:
+                continue
+            child_g = g[via] + distance(via, child)
+            if child in g and g[child] <= child_g:
+                continue
+            g[child] = child_g
+            parent[child] = via
+            heapq.heappush(open_heap, (child_g + distance(child, end), child))
+    return None
 
-            # Add the child to the open list
-            open_list.append(child)
 
+planners = {'astar': _grid_astar, 'jps': _jump_point_search, 'theta': _theta_star}
 
 
 def path_star(matrix):
-    path_star=np.array(matrix)
+    path_star=np.asarray(matrix)
     path_star=list(path_star[:,0])
     path_star_=[]
     for count, element in enumerate(path_star):
@@ -121,31 +300,236 @@ def path_star(matrix):
     return path_star_
 
 def path_end(matrix):
-    path_end=np.array(matrix)
+    path_end=np.asarray(matrix)
+    tath=path_end.shape[1]-1        #last column, also for images that aren't square
     path_end=list(path_end[:,-1])
-    tath=len(path_end)-1
     path_end_=[]
     for count, element in enumerate(path_end):
         if element==0:
             path_end_.append((count,tath))
     return path_end_
 
-def tortusity(matrix):
-    matrix=matrix
+def components(matrix):
+    """Returns an array that labels each free (0) cell of matrix with the index
+    of the first cell of its 8-connected component, and the others with
+    matrix.size."""
+    free = np.asarray(matrix) == 0
+    index = np.arange(free.size).reshape(free.shape)
+    # Pairs of adjacent free cells, each pair once
+    pairs = [(index[:, :-1], index[:, 1:], free[:, :-1] & free[:, 1:]),
+             (index[:-1], index[1:], free[:-1] & free[1:]),
+             (index[:-1, :-1], index[1:, 1:], free[:-1, :-1] & free[1:, 1:]),
+             (index[:-1, 1:], index[1:, :-1], free[:-1, 1:] & free[1:, :-1])]
+    first = np.concatenate([a[both] for a, b, both in pairs])
+    second = np.concatenate([b[both] for a, b, both in pairs])
+    parent = np.arange(free.size)
+    while True:
+        # The root of the larger tree of every pair hangs from the smaller
+        # root, then every cell points straight to its root
+        a, b = parent[first], parent[second]
+        differ = a != b
+        if not differ.any():
+            break
+        np.minimum.at(parent, np.maximum(a, b)[differ], np.minimum(a, b)[differ])
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+    return np.where(free, parent.reshape(free.shape), free.size)
+
+def path_lengths(matrix, starts, ends, labels=None):
+    """Returns an array with the number of cells of the shortest path from each
+    start (rows) to each end (columns), -1 where there is no path.
+
+    All the starts are searched at once with a breadth first wavefront: every
+    cell holds one bit per start, and each step spreads the new bits to the 8
+    adjacent squares, so a single pass over the image serves all the pairs.
+    Each step only covers the bounding box of the cells the last one reached,
+    and the bits of a start stop spreading once it has reached every end of
+    its component, as labelled by components (computed if labels is None)."""
+    maze = np.asarray(matrix)
+    free = maze == 0
+    lengths = np.full((len(starts), len(ends)), -1)
+    if len(starts) == 0 or len(ends) == 0:
+        return lengths
+    starts = np.asarray(starts).reshape(-1, 2)
+    ends = np.asarray(ends).reshape(-1, 2)
+    word = np.arange(len(starts))//64
+    bit = (np.arange(len(starts)) % 64).astype(np.uint64)
+    free_mask = np.where(free, ~np.uint64(0), np.uint64(0))[..., None]
+
+    # Pairs in different components never meet, they are settled from the start
+    labels = components(maze) if labels is None else labels
+    settled = labels[starts[:, 0], starts[:, 1]][:, None] != labels[ends[:, 0], ends[:, 1]]
+
+    reached = np.zeros(free.shape + (word[-1]+1,), dtype=np.uint64)
+    np.bitwise_or.at(reached, (starts[:, 0], starts[:, 1], word), np.uint64(1) << bit)
+    top, left = starts.min(axis=0)
+    frontier = reached[top:starts[:, 0].max()+1, left:starts[:, 1].max()+1].copy()
+    level = 1
+    while True:
+        # Starts whose bit just arrived at each end are level cells away from it
+        bottom, right = top + frontier.shape[0], left + frontier.shape[1]
+        inside = (top <= ends[:, 0]) & (ends[:, 0] < bottom) & (left <= ends[:, 1]) & (ends[:, 1] < right)
+        if inside.any():
+            arrived = (frontier[ends[inside, 0] - top, ends[inside, 1] - left][:, word] >> bit) & np.uint64(1)
+            lengths[:, inside] = np.where(arrived.T == 1, level, lengths[:, inside])
+            settled[:, inside] |= arrived.T == 1
+        done = settled.all(axis=1)
+        if done.all():
+            break
+        done_bits = np.zeros(frontier.shape[2], dtype=np.uint64)
+        np.bitwise_or.at(done_bits, word[done], np.uint64(1) << bit[done])
+
+        # Spread to the 3x3 neighbourhood, first along the columns and then the
+        # rows, over the bounding box of the frontier grown by one cell
+        new_top, new_left = max(top - 1, 0), max(left - 1, 0)
+        window = slice(new_top, min(bottom + 1, free.shape[0])), slice(new_left, min(right + 1, free.shape[1]))
+        spread = np.zeros(reached[window].shape, dtype=np.uint64)
+        spread[top-new_top:bottom-new_top, left-new_left:right-new_left] = frontier
+        grown = spread.copy()
+        grown[1:] |= spread[:-1]
+        grown[:-1] |= spread[1:]
+        spread = grown.copy()
+        spread[:, 1:] |= grown[:, :-1]
+        spread[:, :-1] |= grown[:, 1:]
+        spread &= free_mask[window]
+        spread &= ~reached[window]
+        spread &= ~done_bits
+        reached[window] |= spread
+        occupied = spread.any(axis=2)
+        if not occupied.any():
+            break
+        occupied_rows = np.flatnonzero(occupied.any(axis=1))
+        occupied_cols = np.flatnonzero(occupied.any(axis=0))
+        frontier = spread[occupied_rows[0]:occupied_rows[-1]+1, occupied_cols[0]:occupied_cols[-1]+1]
+        top, left = new_top + occupied_rows[0], new_left + occupied_cols[0]
+        level += 1
+    return lengths
+
+def sum_path_lengths(matrix, starts, ends, method='wavefront', labels=None):
+    """Returns the sum and the number of the lengths of the paths from the
+    starts to the ends, leaving out the pairs without a path."""
+    if method == 'astar':
+        caminos=[]
+        for star in starts:
+            for end in ends:
+                path = astar(matrix, star, end)
+                if path is not None:
+                    caminos.append(len(path))
+    elif method == 'wavefront':
+        # 64 starts at a time keep the wavefront at one word per cell
+        labels = components(matrix) if labels is None else labels
+        caminos = [lengths[lengths != -1] for i in range(0, len(starts), 64)
+                   for lengths in [path_lengths(matrix, starts[i:i+64], ends, labels)]]
+        caminos = np.concatenate(caminos) if caminos else []
+    else:
+        raise ValueError('unknown tortuosity method %r' % (method,))
+    return int(np.sum(caminos)), len(caminos)
+
+#state of each worker process of a parallel tortusity
+_worker = {}
+
+def _attach_maze(name, shape, ends):
+    from multiprocessing import shared_memory
+    _worker['shm'] = shared_memory.SharedMemory(name=name)
+    _worker['maze'] = np.ndarray(shape, dtype=np.uint8, buffer=_worker['shm'].buf)
+    _worker['ends'] = ends
+    _worker['labels'] = None
+
+def _sum_shared_path_lengths(starts, method):
+    if method == 'wavefront' and _worker['labels'] is None:
+        _worker['labels'] = components(_worker['maze'])     #once per worker, not per chunk
+    return sum_path_lengths(_worker['maze'], starts, _worker['ends'], method, _worker['labels'])
+
+def tortusity(matrix, method='wavefront', workers=1):
+    """Mean length of the paths from every inlet to every outlet, relative to
+    the width of the image. Pairs without a path are left out.
+
+    The 'wavefront' method gets all the lengths from path_lengths, 'astar'
+    runs astar on every pair, which is much slower but gives the same result.
+    With workers other than 1 the inlets are split among that many processes
+    (None for one per core), which read the image from shared memory."""
     path_star_list=path_star(matrix)
     path_end_list=path_end(matrix)
-    caminos=[]
-    array_path=np.array(matrix)
-    line=(array_path.shape)[1]
-    for star in path_star_list:
-        for end in path_end_list:
-         
-            path = astar(matrix, star, end)
-            print(path)
-            caminos.append(len(path))
-    valor=(np.mean(np.array(caminos)))
+    line=np.shape(matrix)[1]
+    if workers == 1:
+        total, count = sum_path_lengths(matrix, path_star_list, path_end_list, method)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        from multiprocessing import shared_memory
+        maze = np.asarray(matrix) != 0
+        shm = shared_memory.SharedMemory(create=True, size=max(1, maze.size))
+        try:
+            np.ndarray(maze.shape, dtype=np.uint8, buffer=shm.buf)[...] = maze
+            # A wavefront carries 64 inlets per word, so chunks of up to 64
+            # keep every worker busy without repeating passes over the image
+            size = max(1, min(64, -(-len(path_star_list)//(workers or os.cpu_count()))))
+            chunks = [path_star_list[i:i+size] for i in range(0, len(path_star_list), size)]
+            with ProcessPoolExecutor(workers, initializer=_attach_maze,
+                                     initargs=(shm.name, maze.shape, path_end_list)) as pool:
+                sums = list(pool.map(_sum_shared_path_lengths, chunks, repeat(method)))
+        finally:
+            shm.close()
+            shm.unlink()
+        total = sum(s for s, c in sums)
+        count = sum(c for s, c in sums)
+    valor = total/count if count else np.nan
 
     tortusity=valor/int(line)
     return tortusity
-print(path_star(matrix1))
+
+def save_stack(slices, path, packed=False):
+    """Writes the 2D images of slices, any iterable such as a generator reading
+    them one by one, to the raw file path as a (slices, rows, cols) stack of 0
+    (pore) and 1 (solid) cells, one byte per cell or, with packed, one bit.
+    Only one slice is held in memory. Returns the shape for open_stack."""
+    nr_slices = 0
+    with open(path, 'wb') as f:
+        for image in slices:
+            image = np.asarray(image) != 0
+            if nr_slices == 0:
+                rows, cols = image.shape
+            elif image.shape != (rows, cols):
+                raise ValueError('slice %d is %dx%d, not %dx%d' % ((nr_slices,) + image.shape + (rows, cols)))
+            f.write((np.packbits(image, axis=-1) if packed else image.view(np.uint8)).tobytes())
+            nr_slices += 1
+    if nr_slices == 0:
+        raise ValueError('no slices to save')
+    return nr_slices, rows, cols
+
+class PackedStack():
+    """Stack of bit packed slices memory mapped from a file of save_stack,
+    unpacked to 0/1 bytes one slice at a time when indexed."""
+
+    def __init__(self, path, shape):
+        self.shape = tuple(shape)
+        nr_slices, rows, cols = self.shape
+        self.bits = np.memmap(path, dtype=np.uint8, mode='r', shape=(nr_slices, rows, -(-cols//8)))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, k):
+        return np.unpackbits(self.bits[k], axis=-1, count=self.shape[2])
+
+def open_stack(path, shape, packed=False):
+    """Opens read-only, without loading it, a stack written by save_stack."""
+    if packed:
+        return PackedStack(path, shape)
+    return np.memmap(path, dtype=np.uint8, mode='r', shape=tuple(shape))
+
+def tortusity_slices(stack, method='wavefront', workers=1):
+    """Yields the tortusity of each slice of stack, in order.
+
+    stack is anything with len() whose items are 2D images, like open_stack
+    returns, a 3D array or np.load(..., mmap_mode='r'). Slices are read one at
+    a time and the inlets are searched 64 at a time, so memory stays bounded by
+    a few times the size of a slice, however deep the stack."""
+    for k in range(len(stack)):
+        yield tortusity(stack[k], method, workers)
+
+if __name__ == '__main__':
+    print(path_star(load_maze()))
 
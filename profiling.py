@@ -0,0 +1,138 @@
+"""
+Per-frame timers and counters for the 2D robot simulator
+
+Stages are timed with "with profiler.stage(name):" and events counted with
+profiler.count(name, n); end_frame() closes each frame. A FrameProfiler
+keeps a rolling window of frames for summary(), and can write one JSON
+line per frame and a Chrome trace (chrome://tracing, Perfetto). The
+NullProfiler the simulator uses by default does nothing.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import contextlib
+import json
+import os
+from collections import deque
+from time import perf_counter_ns
+
+
+class NullProfiler():
+    """Profiler that records nothing, at the cost of a method call."""
+
+    _stage = contextlib.nullcontext()
+
+    def stage(self, name):
+        return self._stage
+
+    def count(self, name, n=1):
+        pass
+
+    def end_frame(self):
+        pass
+
+
+class _Stage():
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler   = profiler
+        self.name       = name
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+
+    def __exit__(self, *exc_info):
+        self.profiler._record(self.name, self.start, perf_counter_ns())
+
+
+class FrameProfiler():
+    """Times stages and counts events frame by frame.
+
+    The last window frames are kept for summary(). With jsonl_path every
+    frame is also written as a line of JSON, and with trace_events every
+    stage is kept, up to max_events, for export_chrome_trace()."""
+
+    def __init__(self, window=100, jsonl_path=None, trace_events=False, max_events=1000000):
+        self.frames         = deque(maxlen=window)
+        self.nr_frames      = 0
+        self.stages         = {}        #ns spent in each stage during the current frame
+        self.counters       = {}
+        self.frame_start    = perf_counter_ns()
+        self.origin         = self.frame_start
+        self.jsonl          = open(jsonl_path, 'w') if jsonl_path else None
+        self.trace_events   = [] if trace_events else None
+        self.max_events     = max_events
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def _record(self, name, start, end):
+        self.stages[name] = self.stages.get(name, 0) + end - start
+        if self.trace_events is not None and len(self.trace_events) < self.max_events:
+            self.trace_events.append({'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': 0,
+                                      'ts': (start - self.origin)/1000, 'dur': (end - start)/1000})
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def end_frame(self):
+        """Closes the current frame and starts the next one."""
+        end = perf_counter_ns()
+        frame = {'frame': self.nr_frames,
+                 'ms': (end - self.frame_start)/1e6,
+                 'stages': {name: ns/1e6 for name, ns in self.stages.items()},
+                 'counters': self.counters}
+        self.frames.append(frame)
+        if self.jsonl is not None:
+            self.jsonl.write(json.dumps(frame) + '\n')
+        self.nr_frames += 1
+        self.stages = {}
+        self.counters = {}
+        self.frame_start = end
+
+    def summary(self):
+        """Mean and max of the frame time, stages (ms) and counters over the window."""
+        frames = list(self.frames)
+        result = {'frames': len(frames)}
+        if not frames:
+            return result
+        result['ms'] = _mean_max([f['ms'] for f in frames])
+        for key in ('stages', 'counters'):
+            names = sorted({name for f in frames for name in f[key]})
+            result[key] = {name: _mean_max([f[key].get(name, 0) for f in frames]) for name in names}
+        return result
+
+    def summary_text(self):
+        """One line with the mean ms per frame and per stage, and the mean counters."""
+        summary = self.summary()
+        if not summary['frames']:
+            return 'no frames'
+        parts = ['frame %.2f ms' % summary['ms']['mean']]
+        parts += ['%s %.2f' % (name, s['mean']) for name, s in summary['stages'].items()]
+        parts += ['%s %.0f' % (name, c['mean']) for name, c in summary['counters'].items()]
+        return ', '.join(parts)
+
+    def export_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.trace_events or [], 'displayTimeUnit': 'ms'}, f)
+
+    def close(self):
+        if self.jsonl is not None:
+            self.jsonl.close()
+            self.jsonl = None
+
+
+def _mean_max(values):
+    return {'mean': sum(values)/len(values), 'max': max(values)}
@@ -28,59 +28,66 @@ import math
 import random
 from time import *
 import numpy as np
+import argparse
+from profiling import FrameProfiler
 
 
-def main():
+def main(profile=None):
+    """With profile (a path prefix) every frame is timed by stage: a summary is
+    printed every second, and at the end the frames are in <profile>.jsonl and
+    the stages in <profile>.trace.json, a Chrome trace."""
 
     clock = pygame.time.Clock()
-    screen.fill((255,255,255)) 
 
     robot = init_simulation() # <== Retorna ROBOT, recibe  parametro: numero de obstaculos (por defecto 10) o ambiente
-    display_obstacles()
-
-    allsprites = pygame.sprite.RenderPlain((robot))
-
-    robot.draw_rays(screen)  
-    pygame.display.flip()   
+    profiler = set_profiler(FrameProfiler(fps, profile+'.jsonl', trace_events=True) if profile else None)
+    renderer = Renderer(pygame.display.get_surface(), robot)   #draws obstacles, rays and robot
 
     going = True
     while going:
-        clock.tick(fps)  
+        with profiler.stage('tick'):
+            clock.tick(fps)  
 
         #print(robot.get_pos())  #retorna tupla (x,y)
         #print(robot.get_angle())#retorna angulo (0 es hacia arriba)
         #print(robot.get_collision()) #hay choque: booleano
         #print(robot.read_sensors()) #lista 13 valores de distancia (max 200)
-        #print(robot.get_traces())  #lista de tuplas con las posiciones recorridas por el robot
+        #print(robot.get_traces())  #arreglo (n,2) con las posiciones recorridas por el robot
 
-        for event in pygame.event.get():
-            if event == QUIT:
-                going = False
-            elif event.type == KEYDOWN:
-                if event.key == K_ESCAPE:
+        with profiler.stage('events'):
+            for event in pygame.event.get():
+                if event == QUIT:
                     going = False
-                if event.key == K_r:        #r is for rotation clockwise
-                    robot.spin(-r_step_theta)
-                if event.key == K_e:        #e for rotation counterclockwise
-                    robot.spin(r_step_theta) 
-                if event.key == K_f:        #f is for moving forward
-                    robot.move_fwd()    
-                if event.key == K_SPACE:
-                    robot.opmode = 0            
-                if event.key == K_s: #s is for start
-                    robot.opmode = 1
+                elif event.type == KEYDOWN:
+                    if event.key == K_ESCAPE:
+                        going = False
+                    if event.key == K_r:        #r is for rotation clockwise
+                        robot.spin(-r_step_theta)
+                    if event.key == K_e:        #e for rotation counterclockwise
+                        robot.spin(r_step_theta) 
+                    if event.key == K_f:        #f is for moving forward
+                        robot.move_fwd()    
+                    if event.key == K_SPACE:
+                        robot.opmode = 0            
+                    if event.key == K_s: #s is for start
+                        robot.opmode = 1
         if robot.opmode:
+            with profiler.stage('start'):
                 start(robot)   
-        allsprites.update()
-        screen.fill((255,255,255)) 
-        display_obstacles()
-        robot.draw_rays(screen)
-        draw_traces(robot,screen)
+        with profiler.stage('update'):
+            robot.update()
         if robot.target():
                 report(robot)
                 going = False
-        allsprites.draw(screen)
-        pygame.display.flip()
+        with profiler.stage('render'):
+            renderer.draw()     #only the changed areas reach the display
+        profiler.end_frame()
+        if profile and profiler.nr_frames % fps == 0:
+            print(profiler.summary_text())
+    if profile:
+        profiler.export_chrome_trace(profile+'.trace.json')
+        profiler.close()
+        set_profiler(None)
     pygame.quit()  
 
 def start(robot): # <<<<==================== YOUR CODE  HERE =======
@@ -109,5 +116,7 @@ def report(robot): # <<<<==================== YOUR CODE  HERE ==================
     print(robot.get_time())
 			  
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profile', metavar='PREFIX', help='time every frame, see main')
+    main(parser.parse_args().profile)
 
@@ -0,0 +1,232 @@
+"""
+Simulation server for controllers running in other processes
+
+Serves headless simulations over a Unix or TCP socket with asyncio. Every
+connection is a session with its own world and robot, and any number of
+them share one process: the server switches the simulation to the world of
+a session while it runs that session's commands.
+
+Every message is a little endian uint32 with the length of its body, then
+the body, whose first byte says what it is:
+
+    R  obstacles uint16, ambiente uint8, seed int64
+       builds the session's world (see simulation.generate_world) and robot
+    B  count uint16, then count commands of code uint8, a float32, b float32
+       runs the commands in order: 1 move_fwd, 2 spin(a), 3 sense, 4 move(a, b)
+
+Both are answered with
+
+    O  target uint8, frames uint16, size uint16, then frames x size float32
+       the robot's observe() row after each sense (after R, one frame of the
+       initial sense), and whether the robot is on the target
+    E  a UTF-8 error message; the session goes on, as before the request
+       for bad messages and arguments, which are checked before running any
+       command, or with the commands run before the one that failed
+
+    python server.py --unix /tmp/robots.sock
+    python server.py --port 8765
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import asyncio
+import math
+import socket
+import struct
+import sys
+
+import numpy as np
+import simulation
+
+MOVE_FWD, SPIN, SENSE, MOVE = 1, 2, 3, 4
+
+HEADER      = struct.Struct('<I')
+RESET       = struct.Struct('<HBq')
+COUNT       = struct.Struct('<H')
+COMMAND     = struct.Struct('<Bff')
+FRAMES      = struct.Struct('<BHH')
+max_message = 1 << 16           #longer messages close the connection
+max_move    = max(simulation.display_cols, simulation.display_rows)    #largest dx, dy of a move
+
+active_world = None             #the world the simulation holds right now
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class Session():
+    """The world and robot of one connection."""
+
+    def __init__(self):
+        self.world  = None
+        self.robot  = None
+
+    def handle(self, body):
+        """Returns the answer to a message body, see the module docstring."""
+        if body[:1] == b'R':
+            if len(body) != 1 + RESET.size:
+                raise ProtocolError('R takes %d bytes, not %d' % (RESET.size, len(body)-1))
+            return self.reset(*RESET.unpack_from(body, 1))
+        if body[:1] == b'B':
+            return self.run(body[1:])
+        raise ProtocolError('unknown message %r' % (body[:1],))
+
+    def reset(self, obstacles, ambiente, seed):
+        global active_world
+        self.world = simulation.generate_world(obstacles, ambiente, seed)
+        self.robot = simulation.init_simulation(headless=True, world=self.world)
+        active_world = self.world
+        self.robot.sense()
+        return self._frames([self.robot.observe()])
+
+    def run(self, payload):
+        global active_world
+        if self.robot is None:
+            raise ProtocolError('no world yet, send R first')
+        if len(payload) < COUNT.size:
+            raise ProtocolError('B needs a command count')
+        count, = COUNT.unpack_from(payload)
+        if len(payload) != COUNT.size + count*COMMAND.size:
+            raise ProtocolError('B with %d commands takes %d bytes, not %d'
+                                % (count, COUNT.size + count*COMMAND.size, len(payload)))
+        commands = list(COMMAND.iter_unpack(payload[COUNT.size:]))
+        for code, a, b in commands:         #check them all before running any
+            if code not in (MOVE_FWD, SPIN, SENSE, MOVE):
+                raise ProtocolError('unknown command %d' % code)
+            if not (math.isfinite(a) and math.isfinite(b)):
+                raise ProtocolError('command %d with arguments %r, %r that are not finite' % (code, a, b))
+            if code == MOVE and max(abs(a), abs(b)) > max_move:
+                raise ProtocolError('move by %r, %r, more than %d pixels' % (a, b, max_move))
+        if active_world is not self.world:
+            simulation.use_world(self.world)
+            active_world = self.world
+        robot = self.robot
+        frames = np.empty((sum(code == SENSE for code, a, b in commands), robot.observation_size), dtype='<f4')
+        nr_frames = 0
+        for code, a, b in commands:
+            if code == MOVE_FWD:
+                robot.move_fwd()
+            elif code == SPIN:
+                robot.spin(a)
+            elif code == MOVE:
+                robot.move(a, b)
+            else:
+                robot.sense()
+                robot.observe(frames[nr_frames])
+                nr_frames += 1
+        return self._frames(frames)
+
+    def _frames(self, frames):
+        frames = np.asarray(frames, dtype='<f4').reshape(-1, self.robot.observation_size)
+        return b'O' + FRAMES.pack(self.robot.target(), len(frames), frames.shape[1]) + frames.tobytes()
+
+
+async def handle_connection(reader, writer):
+    session = Session()
+    try:
+        while True:
+            try:
+                length, = HEADER.unpack(await reader.readexactly(HEADER.size))
+                if length > max_message:
+                    break               #can't skip what we won't read, drop the connection
+                body = await reader.readexactly(length)
+            except asyncio.IncompleteReadError:
+                break
+            try:
+                answer = session.handle(body)
+            except ProtocolError as error:
+                answer = b'E' + str(error).encode()
+            except Exception as error:  #a bug shouldn't end the session
+                answer = b'E' + ('%s: %s' % (type(error).__name__, error)).encode()
+            writer.write(HEADER.pack(len(answer)) + answer)
+            await writer.drain()        #also lets the other sessions run
+    finally:
+        writer.close()
+
+
+async def serve(path=None, host='127.0.0.1', port=8765):
+    """Serves sessions on the Unix socket path, or on host and port, forever."""
+    if path:
+        server = await asyncio.start_unix_server(handle_connection, path)
+    else:
+        server = await asyncio.start_server(handle_connection, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+class Client():
+    """Blocking connection to a server, for a controller in another process.
+
+    reset and batch return whether the robot is on the target and the frames
+    of the answer, a (frames, observation_size) array; errors of the server
+    raise ProtocolError."""
+
+    def __init__(self, path=None, host='127.0.0.1', port=8765):
+        if path:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(path)
+        else:
+            self.socket = socket.create_connection((host, port))
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def reset(self, obstacles=10, ambiente=0, seed=0):
+        return self._ask(b'R' + RESET.pack(obstacles, ambiente, seed))
+
+    def batch(self, commands):
+        """Runs the commands, (code,) or (code, a) or (code, a, b) tuples like
+        (SPIN, 15.0), and returns the frames of their SENSE commands."""
+        body = [b'B', COUNT.pack(len(commands))]
+        body += [COMMAND.pack(*(tuple(command) + (0, 0))[:3]) for command in commands]
+        return self._ask(b''.join(body))
+
+    def _ask(self, body):
+        self.socket.sendall(HEADER.pack(len(body)) + body)
+        length, = HEADER.unpack(self._read(HEADER.size))
+        answer = self._read(length)
+        if answer[:1] == b'E':
+            raise ProtocolError(answer[1:].decode())
+        target, nr_frames, size = FRAMES.unpack_from(answer, 1)
+        frames = np.frombuffer(answer, dtype='<f4', offset=1+FRAMES.size).reshape(nr_frames, size)
+        return bool(target), frames
+
+    def _read(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.socket.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError('server closed the connection')
+            data += chunk
+        return bytes(data)
+
+    def close(self):
+        self.socket.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--unix', metavar='PATH', help='serve on this Unix socket instead of TCP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.unix, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
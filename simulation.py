@@ -17,11 +17,17 @@ Simple 2D robot simulator in Python+Pygame
 """
 
 
-import os, pygame
+import os
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')   #importing prints nothing, e.g. in worker processes
+import pygame
 from pygame.locals import *
 import math
 import random
 import time
+import functools
+import numpy as np
+from spatial import UniformGrid
+from profiling import NullProfiler
 
 fps                 = 20        #at most  this many frames per second
 display_cols        = 1200
@@ -31,6 +37,8 @@ wall_color          = 'black'
 target_color        = 'green'
 trace_color         = 'blue'
 trace_decrease      = -17       #negative, subtracts from robot size to make a smaller trace
+trace_capacity      = None      #at most this many trace points are kept, None for no limit
+trace_decimate      = True      #don't store a point again while the robot stays on it
 color_of_nothing    = 'white'
 
 r_init_azi       = 0        #azimuth, in degrees (up is 0)
@@ -41,19 +49,73 @@ r_step_theta     = 7.5      #step for teleop, in azimuth
 r_init_fwd_speed = 5        #pixels per simulation cycle
 r_init_spin_speed= 3        #degrees per simulation cycle
 r_transparency   = 75       #0 is totally transp., 255 totally opaque
+r_sprite_step_theta = 1.5   #rotated sprites are cached every this many degrees, divides the steps above
+r_swept_collision= True     #moves stop at the first obstacle, False undoes moves that end in one
 r_visual_range   = 200      #measured from robot center
 r_visual_angle   = 15       #in degrees, must divide 90 exactly!
 r_visual_granularity = 5    #must be < wall_thickness for walls to be detected correctly!
+grid_cell_size      = 50        #side in pixels of the cells of the obstacle index
+ray_engine          = 'slab'    #'slab' for cast_rays, 'sphere' for sphere_trace over the distance field
+field_resolution    = 1         #side in pixels of the cells of the distance field used by sensing
 
 
 main_dir = os.path.split(os.path.abspath(__file__))[0]
-screen = pygame.display.set_mode((display_cols, display_rows))
+world_cache_dir = os.path.join(main_dir, 'worlds')     #where cached_world saves the worlds it generates
+screen = None                   #the display surface, created by init_simulation unless headless
 list_obstacles = []
 list_rect_obstacles = []
+array_rect_obstacles = np.zeros((0,4), dtype=int)   #left, top, right, bottom of each rect, for the ray caster
+obstacle_grid = UniformGrid(array_rect_obstacles, display_cols, display_rows, grid_cell_size)
+profiler = NullProfiler()       #times stages and counts tests when replaced, see set_profiler
+occupancy_grids = {}            #(resolution, inflate) -> occupancy grid of the obstacles, see occupancy_grid
+distance_fields = {}            #resolution -> distance field of the obstacles, see distance_field
+palette = [pygame.Color(color_of_nothing), pygame.Color(wall_color), pygame.Color(target_color)]  #see palette_index
+array_palette_obstacles = np.zeros(0, dtype=np.uint8)   #palette index of the color of each obstacle
+
+class TraceBuffer():
+    """Centers of the trace points, as an array of int16 (x,y) rows.
+
+    Without a capacity the array doubles when full. With one it is a ring
+    that drops the oldest points; every point is written twice, capacity
+    rows apart, so that the kept points are always a contiguous slice."""
+
+    def __init__(self, capacity=None, decimate=True):
+        if capacity is not None and capacity < 1:
+            raise ValueError('a trace capacity must be at least 1, or None for no limit, not %r' % (capacity,))
+        self.capacity   = capacity
+        self.decimate   = decimate
+        self.data       = np.zeros((2*capacity if capacity else 256, 2), dtype=np.int16)
+        self.start      = 0
+        self.size       = 0
+        self.total      = 0             #points appended since creation, kept or not
+        self.last       = None
+
+    def __len__(self):
+        return self.size
+
+    def append(self, x, y):
+        if self.decimate and self.last == (x, y):
+            return
+        self.last = (x, y)
+        if self.capacity is None:
+            if self.size == len(self.data):
+                self.data = np.concatenate([self.data, np.zeros_like(self.data)])
+            self.data[self.size] = x, y
+            self.size += 1
+        else:
+            end = (self.start + self.size) % self.capacity
+            self.data[end] = self.data[end+self.capacity] = x, y
+            if self.size < self.capacity:
+                self.size += 1
+            else:
+                self.start = (self.start + 1) % self.capacity
+        self.total += 1
 
-class Trace():
-    def __init__(self, from_rect):
-        self.rect       = from_rect
+    def view(self):
+        """Returns the kept points, oldest first, as a read-only view (no copy)."""
+        points = self.data[self.start:self.start+self.size]
+        points.flags.writeable = False
+        return points
 
 class Obstacle(pygame.Rect):
     def __init__(self, x_topleft, y_topleft, width, height, color):
@@ -76,9 +138,10 @@ class Robot(pygame.sprite.Sprite):
         self.fwd_speed      = fwd_speed
         self.spin_speed     = spin_speed
         self.leave_trace    = 1
+        self.render         = True          #False to skip the image rotations of headless runs
         self.start_time     = 0
         self.end_time       = 0
-        self.list_traces    = []
+        self.traces         = TraceBuffer(trace_capacity, trace_decimate)
         self.azi            = azimuth       #in degrees
         self.collided       = False
         self.opmode         = 0             
@@ -89,12 +152,13 @@ class Robot(pygame.sprite.Sprite):
         self.nr_sensors     = 2*90/self.visual_angle+1
         self.retina         = list([self.visual_range, pygame.Color(color_of_nothing)]\
                                    for i in range(int(self.nr_sensors)))
+        #the same readings as arrays, updated in place: distances and palette indices of the colors
+        self.retina_distances = np.full(int(self.nr_sensors), self.visual_range, dtype=np.int32)
+        self.retina_palette   = np.zeros(int(self.nr_sensors), dtype=np.uint8)
+        self.observation_size = 4 + 2*int(self.nr_sensors)     #see observe
 
     def printRetina(self):
-        distances = []
-        for s in self.retina:
-            distances.append(s[0])
-        return distances
+        return self.retina_distances.tolist()
 
     def update(self):
         self.sense() 
@@ -109,15 +173,21 @@ class Robot(pygame.sprite.Sprite):
         self.move(walk_dx, walk_dy)
 
     def move(self,dx,dy):
-        previous_rect = self.rect           #remember in case undo is necessary
-        self.rect = self.rect.move(dx,dy)
-        if self.rect.collidelist(list_rect_obstacles) != -1:#if collision exists
-            self.rect = previous_rect                   #undo the move
+        with profiler.stage('collision'):
+            if r_swept_collision:       #stop where the first obstacle is met
+                moved, hit = swept_move(self.rect, dx, dy)
+            else:                       #undo the whole move if it ends in an obstacle
+                moved = self.rect.move(dx,dy)
+                hit = colliding_obstacle(moved)
+                if hit != -1:
+                    moved = self.rect
+        if hit != -1:           #if collision exists
             self.collided = True
-        else:                   #if there was no collision
+        if hit == -1 or moved != self.rect:     #if the robot moved
+            self.rect = moved
             if self.leave_trace:     #update trace list
                 tr = self.rect.inflate(trace_decrease, trace_decrease)
-                self.list_traces.append(Trace(tr))
+                self.traces.append(*tr.center)
 
 
     def spin(self,dtheta):
@@ -130,58 +200,58 @@ class Robot(pygame.sprite.Sprite):
             self.azi = self.azi-360
         if self.azi <= -360: 
             self.azi = self.azi+360
-        original_rect = self.image_original.get_rect()
-        rotated_image = pygame.transform.rotate(self.image_original, self.azi)
-        rotated_rect  = original_rect.copy()
-        rotated_rect.center = rotated_image.get_rect().center
-        self.image = rotated_image.subsurface(rotated_rect).copy()
-        self.image = change_alpha_for_alpha(self.image, r_transparency)
+        if self.render:
+            bucket = round(self.azi/r_sprite_step_theta) % round(360/r_sprite_step_theta)
+            self.image = rotated_sprite(self.image_original, bucket)
         if self.leave_trace:     #update trace lis
             tr = self.rect.inflate(trace_decrease, trace_decrease)
-            self.list_traces.append(Trace(tr))
+            self.traces.append(*tr.center)
     
     #this function's job is to place in self.retina the range sensed by each sensor
     def sense(self):
         n = int((self.nr_sensors - 1)/2)#the "natural" sensor range is -n to +n
         granu = r_visual_granularity    #must be at least as large as the wall thickness!!
-        for i in range(-n,n+1):         #sense with each of the 2n+1 range sensors
-            ang = (self.azi - i*self.visual_angle)*math.pi/180
-            for distance in range(granu, self.visual_range+granu, granu):
-                x = self.rect.center[0]-distance*math.sin(ang)  #endpoint coordinates
-                y = self.rect.center[1]-distance*math.cos(ang)
-                nr_collisions = 0
-                count = -1          #needed to coordinate the two lists, to extract color after loop
-                for ob in list_rect_obstacles:  #use the stripped-down list of rectangles for speed
-                    count = count + 1
-                    if ob.collidepoint(x,y):
-                        nr_collisions = 1
-                        break       #breaks out of wall loop
-                if nr_collisions:   #non-zero collision
-                    break           #breaks out of distance loop
-            #distance now has the min. between the visual range and the first collision
-            self.retina[i+n][0] = distance
-            if nr_collisions:       #nr_collisions is 1 if a collision has occurred
-                self.retina[i+n][1] = list_obstacles[count].color #color comes form the larger list
+        with profiler.stage('sense'):
+            angs = [(self.azi - i*self.visual_angle)*math.pi/180 for i in range(-n,n+1)]
+            sins = [math.sin(ang) for ang in angs]
+            coss = [math.cos(ang) for ang in angs]
+            x, y = self.rect.center
+            reach = len(range(granu, self.visual_range+granu, granu))*granu
+            #only the obstacles in the grid cells along the rays can be seen
+            near = obstacle_grid.query_segments(x, y, [x-reach*s for s in sins], [y-reach*c for c in coss])
+            if ray_engine == 'sphere':
+                #the rays jump through free space as far as the distance field allows
+                distances, hits = sphere_trace(x, y, sins, coss, array_rect_obstacles[near],
+                                               distance_field(field_resolution), field_resolution,
+                                               self.visual_range, granu)
             else:
-                self.retina[i+n][1] = pygame.Color(color_of_nothing)
+                #all the 2n+1 rays are cast against those obstacles in a single batch
+                distances, hits = cast_rays(x, y, sins, coss, array_rect_obstacles[near], self.visual_range, granu)
+            profiler.count('rays', len(angs))
+            profiler.count('obstacle_tests', len(angs)*len(near))
+            self.retina_distances[:] = distances
+            seen = hits != -1           #hits are indices of the nearby obstacles, -1 for none
+            self.retina_palette[:] = 0
+            self.retina_palette[seen] = array_palette_obstacles[near[hits[seen]]]
+            for i, (distance, color) in enumerate(zip(distances.tolist(), self.retina_palette.tolist())):
+                self.retina[i][0] = distance
+                self.retina[i][1] = palette[color]
         return self.printRetina()
-
           
     def draw_rays(self, target_surf):
         n = int((self.nr_sensors - 1)/2 )#the "natural" sensor range -n to +n
+        rects = []                  #areas changed by each ray
         for i in range(-n,n+1):     #draw the 2n+1 rays of the range sensors
             ang = (self.azi - i*self.visual_angle)*math.pi/180
             x = self.rect.center[0]-self.retina[i+n][0]*math.sin(ang)
             y = self.rect.center[1]-self.retina[i+n][0]*math.cos(ang)
             #use aaline for smoother (but slower) lines
-            pygame.draw.line(target_surf, (0,0,0), self.rect.center, (x,y))
+            rects.append(pygame.draw.line(target_surf, (0,0,0), self.rect.center, (x,y)))
+        return rects
 
 
     def get_traces(self):
-        list_final=[]
-        for t in self.list_traces:
-            list_final.append((t.rect.center[0],t.rect.center[1]))
-        return list_final
+        return self.traces.view()   #(n,2) array of the x,y positions, not a copy
 
     def get_pos(self):
         return tuple(self.rect.center)
@@ -189,12 +259,44 @@ class Robot(pygame.sprite.Sprite):
     def get_angle(self):
         return self.azi
 
+    def get_clearance(self):
+        """Distance from the robot center to the nearest obstacle, see clearance."""
+        return clearance(*self.rect.center)
+
     def get_collision(self):
         return self.collided
 
     def read_sensors(self):
         return self.printRetina()
 
+    def observe(self, out=None):
+        """Writes into out, a float array of observation_size, the x, y of the
+        center, the azimuth, 1 if collided else 0, the distances sensed and the
+        palette indices of the colors seen, as of the last sense. Returns out,
+        a new array if none was given."""
+        n = len(self.retina_distances)
+        if out is None:
+            out = np.empty(self.observation_size)
+        out[0], out[1] = self.rect.center
+        out[2] = self.azi
+        out[3] = self.collided
+        out[4:4+n] = self.retina_distances
+        out[4+n:4+2*n] = self.retina_palette
+        return out
+
+    def run_steps(self, controller, out):
+        """Runs a simulation cycle for each row of out, a (steps, observation_size)
+        float array: controller(robot) then update, as run_headless does, then
+        observe into the row. Stops after the cycle that reaches the target and
+        returns the number of rows filled."""
+        for step in range(len(out)):
+            controller(self)
+            self.update()
+            self.observe(out[step])
+            if self.target():
+                return step + 1
+        return len(out)
+
 
     def target(self):
         if self.rect.center[0]>= 1120 and self.rect.center[1] <= 68:
@@ -210,83 +312,605 @@ class Robot(pygame.sprite.Sprite):
 
 
 def change_alpha_for_white(surface,new_alpha):
-    size = surface.get_size()
-    if size[0]>300 or size[1]>300:
-        return surface
-    for y in range(size[1]):
-        for x in range(size[0]):
-            r,g,b,a = surface.get_at((x,y))
-            if r==255 and g==255 and b==255:
-                surface.set_at((x,y),(r,g,b,new_alpha))
+    if not surface.get_flags() & SRCALPHA:
+        return surface          #without per-pixel alpha there is nothing to change
+    rgb = pygame.surfarray.pixels3d(surface)
+    alpha = pygame.surfarray.pixels_alpha(surface)
+    alpha[(rgb == 255).all(axis=2)] = new_alpha
+    del rgb, alpha              #the arrays lock the surface while they exist
     return surface
 
 def change_alpha_for_alpha(surface,new_alpha):
-    size = surface.get_size()
-    for y in range(size[1]):
-        for x in range(size[0]):
-            r,g,b,a = surface.get_at((x,y))
-            if a<200:
-                surface.set_at((x,y),(r,g,b,new_alpha))
+    if not surface.get_flags() & SRCALPHA:
+        return surface
+    alpha = pygame.surfarray.pixels_alpha(surface)
+    alpha[alpha < 200] = new_alpha
+    del alpha
     return surface
 
+def rects_to_array(rects):
+    """Returns the rects as an (N,4) int array of left, top, right, bottom."""
+    array = np.zeros((len(rects),4), dtype=int)
+    for i, rect in enumerate(rects):
+        array[i] = rect.left, rect.top, rect.right, rect.bottom
+    return array
+
+def _slab(origin, step, low, high):
+    """Returns the interval of t for which origin - t*step lies between low and high."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t1 = (origin - low)/step
+        t2 = (origin - high)/step
+    parallel = step == 0
+    inside = (low <= origin) & (origin <= high)
+    t_in  = np.where(parallel, np.where(inside, -np.inf, np.inf), np.minimum(t1, t2))
+    t_out = np.where(parallel, np.where(inside, np.inf, -np.inf), np.maximum(t1, t2))
+    return t_in, t_out
+
+def _crossed(origin, step, bound, distance):
+    """True where the sampled coordinate origin - distance*step has crossed bound,
+    truncated towards zero like Rect.collidepoint does."""
+    coord = np.trunc(origin - distance*step)
+    return np.where(step >= 0, coord < bound, coord >= bound)
+
+def _first_crossing(origin, step, bound, granu, lo, hi):
+    """Binary search for the first sample k in [lo,hi) whose coordinate has crossed
+    bound, hi if none. The crossing is monotone in k, as the ray never turns back."""
+    lo, hi = lo.copy(), hi.copy()
+    active = lo < hi
+    while active.any():
+        mid = (lo + hi)//2
+        crossed = _crossed(origin, step, bound, mid*granu)
+        hi = np.where(active & crossed, mid, hi)
+        lo = np.where(active & ~crossed, mid+1, lo)
+        active = lo < hi
+    return lo
+
+def cast_rays(x, y, sin_a, cos_a, rects, visual_range, granu):
+    """Casts rays from (x,y) along the azimuths given by sin_a and cos_a against
+    an array of rects (see rects_to_array).
+
+    The result is exactly the one of marching each ray in steps of granu and
+    testing every point with Rect.collidepoint: for every ray it returns the
+    first sampled distance inside an obstacle (or the last sample if none is
+    hit) and the index of the obstacle hit first, -1 for none.
+    A slab test of every ray against every rect, grown by one pixel to absorb
+    rounding, discards the pairs that can't meet and brackets the entry
+    point of the others, which is then pinned down on the samples themselves.
+    """
+    x, y, sin_a, cos_a = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (x, y, sin_a, cos_a)))
+    shape = x.shape
+    x, y, sin_a, cos_a = x.ravel(), y.ravel(), sin_a.ravel(), cos_a.ravel()
+    nr_steps = len(range(granu, visual_range+granu, granu))
+    distances = np.full(x.size, nr_steps*granu, dtype=int)
+    hits = np.full(x.size, -1, dtype=int)
+    if len(rects) == 0 or x.size == 0:
+        return distances.reshape(shape), hits.reshape(shape)
+    left, top, right, bottom = (rects[:,j] for j in range(4))
+    tx_in, tx_out = _slab(x[:,None], sin_a[:,None], left-1, right+1)
+    ty_in, ty_out = _slab(y[:,None], cos_a[:,None], top-1, bottom+1)
+    t_in = np.maximum(tx_in, ty_in)
+    t_out = np.minimum(tx_out, ty_out)
+    ray, ob = np.nonzero((t_in <= t_out) & (t_out >= granu) & (t_in <= nr_steps*granu))
+    if ray.size == 0:
+        return distances.reshape(shape), hits.reshape(shape)
+    x, y, sin_a, cos_a = x[ray], y[ray], sin_a[ray], cos_a[ray]
+    left, top, right, bottom = left[ob], top[ob], right[ob], bottom[ob]
+    lo = np.clip(np.floor(t_in[ray,ob]/granu), 1, nr_steps+1).astype(int)
+    hi = np.clip(np.floor(t_out[ray,ob]/granu)+1, lo, nr_steps+1).astype(int)
+    #first sample past the near side of each slab; the ray is inside the rect
+    #from the later of the two, unless it is already past a far side by then
+    near_x = np.where(sin_a >= 0, right, left)
+    near_y = np.where(cos_a >= 0, bottom, top)
+    k = np.maximum(_first_crossing(x, sin_a, near_x, granu, lo, hi),
+                   _first_crossing(y, cos_a, near_y, granu, lo, hi))
+    inside = k <= nr_steps
+    distance = k*granu
+    inside &= _crossed(x, sin_a, near_x, distance) & _crossed(y, cos_a, near_y, distance)
+    inside &= ~_crossed(x, sin_a, np.where(sin_a >= 0, left, right), distance)
+    inside &= ~_crossed(y, cos_a, np.where(cos_a >= 0, top, bottom), distance)
+    #first sample along each ray, ties go to the first obstacle in the list
+    key = np.full(distances.size, np.iinfo(np.int64).max)
+    np.minimum.at(key, ray[inside], k[inside]*len(rects) + ob[inside])
+    hit = key != np.iinfo(np.int64).max
+    distances[hit] = key[hit]//len(rects)*granu
+    hits[hit] = key[hit] % len(rects)
+    return distances.reshape(shape), hits.reshape(shape)
+
+def sphere_trace(x, y, sin_a, cos_a, rects, field, resolution, visual_range, granu):
+    """Same as cast_rays, but each ray skips all the samples that the distance
+    field (see distance_field) proves to be clear of the rects, which must
+    be the ones the field was built from or a subset holding every rect the
+    rays can reach. Only samples in cells touching an obstacle, or outside
+    the field, are tested against the rects."""
+    x, y, sin_a, cos_a = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (x, y, sin_a, cos_a)))
+    shape = x.shape
+    x, y, sin_a, cos_a = x.ravel(), y.ravel(), sin_a.ravel(), cos_a.ravel()
+    nr_steps = len(range(granu, visual_range+granu, granu))
+    distances = np.full(x.size, nr_steps*granu, dtype=int)
+    hits = np.full(x.size, -1, dtype=int)
+    k = np.ones(x.size, dtype=int)          #next sample of each ray
+    ray = np.arange(x.size)                 #rays still going
+    while ray.size:
+        distance = k[ray]*granu
+        px = np.trunc(x[ray] - distance*sin_a[ray])
+        py = np.trunc(y[ray] - distance*cos_a[ray])
+        row, col = (py//resolution).astype(int), (px//resolution).astype(int)
+        in_field = (row >= 0) & (row < field.shape[0]) & (col >= 0) & (col < field.shape[1])
+        clear = np.where(in_field, field[np.clip(row, 0, field.shape[0]-1), np.clip(col, 0, field.shape[1]-1)], 0)
+        profiler.count('ray_samples', ray.size)
+        #a sample j*granu further along lands on a pixel less than j*granu+sqrt(2)
+        #away from this one, so it is clear while that is below the field value
+        step = np.maximum(np.floor((clear - 1.5)/granu).astype(int) + 1, 1)
+        test = np.nonzero(clear == 0)[0]
+        if test.size and len(rects):
+            inside = ((rects[:,0] <= px[test,None]) & (px[test,None] < rects[:,2]) &
+                      (rects[:,1] <= py[test,None]) & (py[test,None] < rects[:,3]))
+            hit = inside.any(axis=1)
+            distances[ray[test[hit]]] = distance[test[hit]]
+            hits[ray[test[hit]]] = inside[hit].argmax(axis=1)   #first obstacle in the list
+            step[test[hit]] = nr_steps + 1                      #stops the ray
+        k[ray] += step
+        ray = ray[k[ray] <= nr_steps]
+    return distances.reshape(shape), hits.reshape(shape)
+
+def sweep_boxes(boxes, delta, rects):
+    """Sweeps the (K,4) left, top, right, bottom boxes along their (K,2) deltas
+    against the (M,4) rects. Returns the time of impact of each box, the
+    fraction of its delta it can go before overlapping a rect (1 if it never
+    does, 0 if it already overlaps one), and the index of that rect, -1 for
+    none. Touching doesn't count as overlapping, as in Rect.colliderect."""
+    boxes = np.asarray(boxes, dtype=float).reshape(-1,4)
+    delta = np.asarray(delta, dtype=float).reshape(-1,2)
+    rects = np.asarray(rects).reshape(-1,4)
+    if len(rects) == 0:
+        return np.ones(len(boxes)), np.full(len(boxes), -1)
+    enter = np.full((len(boxes), len(rects)), -np.inf)
+    leave = np.full((len(boxes), len(rects)), np.inf)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for axis in (0, 1):
+            low, high, step = boxes[:,axis,None], boxes[:,axis+2,None], delta[:,axis,None]
+            #times at which the box starts and stops overlapping the rects along this axis
+            t_low = (rects[:,axis] - high)/step
+            t_high = (rects[:,axis+2] - low)/step
+            still = (low < rects[:,axis+2]) & (rects[:,axis] < high)    #for boxes not moving along it
+            enter = np.maximum(enter, np.where(step > 0, t_low, np.where(step < 0, t_high,
+                                                                          np.where(still, -np.inf, np.inf))))
+            leave = np.minimum(leave, np.where(step > 0, t_high, np.where(step < 0, t_low,
+                                                                          np.where(still, np.inf, -np.inf))))
+    hits = (enter < leave) & (enter < 1) & (leave > 0)
+    times = np.where(hits, np.maximum(enter, 0), 1.0)
+    first = times.argmin(axis=1)
+    return times[np.arange(len(boxes)), first], np.where(hits.any(axis=1), first, -1)
+
+def contact_offsets(delta, toi):
+    """Whole pixel offsets reached after toi of the (K,2) integer deltas,
+    rounded towards the start unless they are whole up to float error."""
+    offsets = np.asarray(toi, dtype=float)[:,None]*delta
+    nearest = np.round(offsets)
+    return np.where(np.abs(offsets - nearest) < 1e-6, nearest, np.trunc(offsets)).astype(int)
+
+def swept_move(rect, dx, dy):
+    """Returns rect moved by dx, dy (truncated, as by Rect.move) up to the first
+    obstacle in its way, and the index of that obstacle, -1 if it got all the
+    way. If the contact rounded to whole pixels clips a corner, rect is
+    returned unmoved."""
+    delta = int(dx), int(dy)
+    target = rect.move(delta)
+    swept = rect.union(target)
+    near = obstacle_grid.query_rect(swept)
+    profiler.count('collision_tests', len(near))
+    if swept.collidelist([list_rect_obstacles[i] for i in near.tolist()]) == -1:
+        return target, -1           #nothing anywhere near the way
+    toi, hit = sweep_boxes([rect.left, rect.top, rect.right, rect.bottom], delta, array_rect_obstacles[near])
+    if hit[0] == -1:
+        return target, -1
+    moved = rect.move(*contact_offsets([delta], toi)[0].tolist())
+    if colliding_obstacle(moved) != -1:
+        moved = rect
+    return moved, int(near[hit[0]])
+
+def colliding_obstacle(rect):
+    """Returns the index of the first obstacle colliding with rect, -1 for none."""
+    near = obstacle_grid.query_rect(rect).tolist()
+    profiler.count('collision_tests', len(near))
+    count = rect.collidelist([list_rect_obstacles[i] for i in near])
+    return near[count] if count != -1 else -1
+
+@functools.lru_cache(maxsize=1024)
+def rotated_sprite(image, bucket):
+    """Returns image rotated by bucket*r_sprite_step_theta degrees, cropped to
+    its original size and made transparent. Sprites are computed once per
+    bucket and then shared, they must not be modified."""
+    original_rect = image.get_rect()
+    rotated_image = pygame.transform.rotate(image, bucket*r_sprite_step_theta)
+    rotated_rect  = original_rect.copy()
+    rotated_rect.center = rotated_image.get_rect().center
+    rotated_image = rotated_image.subsurface(rotated_rect).copy()
+    return change_alpha_for_alpha(rotated_image, r_transparency)
+
 def draw_traces(robot,target_surf):
-    for t in robot.list_traces:
-        pygame.draw.circle(target_surf, pygame.Color(trace_color), t.rect.center, 2, 0) 
+    for center in robot.get_traces().tolist():
+        pygame.draw.circle(target_surf, pygame.Color(trace_color), center, 2, 0) 
     return robot.target()
 
-def load_image(name):
+def load_image(name, headless=False):
     path = os.path.join(main_dir, name)
-    temp_image = pygame.image.load(path).convert_alpha()  #need this if using ppalpha
+    temp_image = pygame.image.load(path)
+    if headless:            #convert_alpha needs a display, copy onto a per-pixel alpha surface instead
+        surface = pygame.Surface(temp_image.get_size(), pygame.SRCALPHA)
+        surface.blit(temp_image, (0,0))
+        temp_image = surface
+    else:
+        temp_image = temp_image.convert_alpha()  #need this if using ppalpha
     return change_alpha_for_white(temp_image, r_transparency)  
 
 
-def init_simulation(obstacles=10,ambiente=0):
-    pygame.init()  
-    pygame.display.set_caption('Pyweekend - 1er Hackathon ESPOL 2018')
-    pygame.display.set_icon(pygame.image.load('ESPOL.png'))
-    r_sprite = load_image('robo1.bmp')
-
-    r=Robot(r_sprite, r_init_x_topleft, r_init_y_topleft,r_init_azi, r_init_fwd_speed,r_init_spin_speed, r_visual_range, r_visual_angle)
-
+class World():
+    """The obstacles of a simulation with their rects, rect array and grid index,
+    and the occupancy grids and distance fields computed for them so far.
+
+    Worlds come from generate_world, load_world or cached_world, and become
+    the world of the simulation through use_world or init_simulation; later
+    changes to the simulation, like add_obstacle, don't touch them."""
+
+    def __init__(self, obstacles, seed=None, ambiente=0, nr_obstacles=0, buckets=None):
+        self.obstacles      = list(obstacles)
+        self.rects          = [pygame.Rect(ob.x_topleft,ob.y_topleft,ob.width,ob.height) for ob in self.obstacles]
+        self.array          = rects_to_array(self.rects)
+        self.grid           = UniformGrid(self.array, display_cols, display_rows, grid_cell_size, buckets)
+        self.seed           = seed
+        self.ambiente       = ambiente
+        self.nr_obstacles   = nr_obstacles
+        self.occupancy_grids = {}       #as the module caches of the same name
+        self.distance_fields = {}
+
+    def occupancy_grid(self, resolution=1, inflate=0):
+        key = (resolution, inflate)
+        if key not in self.occupancy_grids:
+            self.occupancy_grids[key] = _new_occupancy_grid(self.array, resolution, inflate)
+        return self.occupancy_grids[key]
+
+    def distance_field(self, resolution=1):
+        if resolution not in self.distance_fields:
+            self.distance_fields[resolution] = _new_distance_field(self.array, resolution)
+        return self.distance_fields[resolution]
+
+    def save(self, file):
+        """Writes the world, its grid index and the grids computed so far to
+        file, a path or an open binary file, in the .npz format."""
+        arrays = {'settings': np.array(world_settings()),
+                  'seed': np.array([] if self.seed is None else [self.seed], dtype=np.int64),
+                  'ambiente': np.array(self.ambiente),
+                  'nr_obstacles': np.array(self.nr_obstacles),
+                  'rects': self.array,
+                  'colors': np.array([tuple(ob.color) for ob in self.obstacles], dtype=np.uint8).reshape(-1,4),
+                  'grid_start': self.grid.start,
+                  'grid_items': self.grid.items}
+        for (resolution, inflate), grid in self.occupancy_grids.items():
+            arrays['occupancy_%d_%d' % (resolution, inflate)] = grid
+        for resolution, field in self.distance_fields.items():
+            arrays['distance_%d' % resolution] = field
+        np.savez_compressed(file, **arrays)
+
+def world_settings():
+    """The settings a saved world depends on, besides its seed and ambiente."""
+    return display_cols, display_rows, wall_thickness, grid_cell_size
+
+def generate_world(obstacles=10, ambiente=0, seed=None):
+    """Builds the walls, the obstacles of ambiente and the target as a World.
+    Ambiente 0 has obstacles random obstacles, drawn from random.Random(seed),
+    or from the random module when seed is None."""
+    rng = random if seed is None else random.Random(seed)
+    world_obstacles = []
     w01 = Obstacle(0,0,display_cols,wall_thickness, wall_color)                          #top wall
-    list_obstacles.append(w01)
+    world_obstacles.append(w01)
     w02 = Obstacle(display_cols-wall_thickness,0,wall_thickness,display_rows,wall_color) #right wall
-    list_obstacles.append(w02)
+    world_obstacles.append(w02)
     w03 = Obstacle(0,display_rows-wall_thickness,display_cols,wall_thickness,wall_color) #bottom wall
-    list_obstacles.append(w03)
+    world_obstacles.append(w03)
     w04 = Obstacle(0,0,wall_thickness,display_rows, wall_color)                          #left wall
-    list_obstacles.append(w04)
+    world_obstacles.append(w04)
 
     if ambiente == 1:
-        ambiente1(list_obstacles)
+        ambiente1(world_obstacles)
     elif ambiente == 2:
-        ambiente2(list_obstacles)
+        ambiente2(world_obstacles)
     else:
         for i in range(int(obstacles/2)):
-            col=random.randint(0,display_cols-30)
-            row=random.randint(0,display_rows-120)
+            col=rng.randint(0,display_cols-30)
+            row=rng.randint(0,display_rows-120)
             obs = Obstacle(col,row,30,120,wall_color)
-            list_obstacles.append(obs)
+            world_obstacles.append(obs)
     
-            col=random.randint(0,display_cols-120)
-            row=random.randint(0,display_rows-30)
+            col=rng.randint(0,display_cols-120)
+            row=rng.randint(0,display_rows-30)
             obs = Obstacle(col,row,120,30,wall_color)
-            list_obstacles.append(obs)
-
+            world_obstacles.append(obs)
 
     target = Obstacle(1150,20,20,20,target_color)
-    list_obstacles.append(target)
-    for ob in list_obstacles:
-        list_rect_obstacles.append(pygame.Rect(ob.x_topleft,ob.y_topleft,ob.width,ob.height))
+    world_obstacles.append(target)
+    return World(world_obstacles, seed, ambiente, obstacles)
+
+def load_world(file):
+    """Reads a World written by World.save, without rebuilding its index or
+    grids. Raises ValueError if it was saved with other world_settings."""
+    with np.load(file) as data:
+        if tuple(data['settings'].tolist()) != world_settings():
+            raise ValueError('world saved with other settings: %s' % (data['settings'].tolist(),))
+        obstacles = [Obstacle(left, top, right-left, bottom-top, tuple(color))
+                     for (left, top, right, bottom), color in zip(data['rects'].tolist(), data['colors'].tolist())]
+        seed = data['seed'].tolist()
+        world = World(obstacles, seed[0] if seed else None, int(data['ambiente']), int(data['nr_obstacles']),
+                      (data['grid_start'], data['grid_items']))
+        for name in data.files:
+            if name.startswith('occupancy_'):
+                resolution, inflate = name.split('_')[1:]
+                world.occupancy_grids[int(resolution), int(inflate)] = data[name]
+            elif name.startswith('distance_'):
+                world.distance_fields[int(name.split('_')[1])] = data[name]
+    return world
+
+def cached_world(obstacles=10, ambiente=0, seed=0, grids=((1, 0),), cache_dir=None):
+    """Returns generate_world(obstacles, ambiente, seed), read from cache_dir
+    (world_cache_dir by default) if it was saved there before. New worlds are
+    saved with the occupancy grids of the (resolution, inflate) pairs in grids.
+    Unseeded worlds (seed None) are different every time, they aren't cached."""
+    if seed is None:
+        world = generate_world(obstacles, ambiente)
+        for resolution, inflate in grids:
+            world.occupancy_grid(resolution, inflate)
+        return world
+    cache_dir = cache_dir or world_cache_dir
+    path = os.path.join(cache_dir, 'world_o%d_a%d_s%d.npz' % (obstacles, ambiente, seed))
+    if os.path.exists(path):
+        try:
+            return load_world(path)
+        except ValueError:
+            pass                    #settings changed since, generate it again
+    world = generate_world(obstacles, ambiente, seed)
+    for resolution, inflate in grids:
+        world.occupancy_grid(resolution, inflate)
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = '%s.%d.tmp' % (path, os.getpid())      #other processes may be writing it too
+    with open(temp_path, 'wb') as f:
+        world.save(f)
+    os.replace(temp_path, path)
+    return world
+
+def use_world(world):
+    """Makes world the world of the simulation, replacing the obstacles, index
+    and cached grids of the previous one. The grids are copied, so that
+    add_obstacle and remove_obstacle leave the World as it was."""
+    global array_rect_obstacles, obstacle_grid
+    list_obstacles[:] = world.obstacles
+    list_rect_obstacles[:] = world.rects
+    array_rect_obstacles = world.array
+    obstacle_grid = world.grid
+    index_colors()
+    occupancy_grids.clear()
+    occupancy_grids.update((key, grid.copy()) for key, grid in world.occupancy_grids.items())
+    distance_fields.clear()
+    distance_fields.update((key, field.copy()) for key, field in world.distance_fields.items())
+
+def init_simulation(obstacles=10,ambiente=0,headless=False,seed=None,world=None):
+    """Builds the world and returns the robot. A headless world opens no
+    window and its robot doesn't rotate its image, see run_headless.
+
+    The world is generate_world(obstacles, ambiente, seed), unless a World is
+    given; either way it replaces the world of any previous call."""
+    global screen
+    if not headless:
+        pygame.init()  
+        screen = pygame.display.set_mode((display_cols, display_rows))
+        pygame.display.set_caption('Pyweekend - 1er Hackathon ESPOL 2018')
+        pygame.display.set_icon(pygame.image.load('ESPOL.png'))
+    r_sprite = load_image('robo1.bmp', headless)
+
+    r=Robot(r_sprite, r_init_x_topleft, r_init_y_topleft,r_init_azi, r_init_fwd_speed,r_init_spin_speed, r_visual_range, r_visual_angle)
+    r.render = not headless
+
+    use_world(world if world is not None else generate_world(obstacles, ambiente, seed))
     r.start_time = time.time()
     return r
 
-def display_obstacles():
+def set_profiler(new_profiler):
+    """Makes the simulation report to new_profiler (a profiling.FrameProfiler),
+    None to stop profiling. Returns the profiler in use."""
+    global profiler
+    profiler = new_profiler if new_profiler is not None else NullProfiler()
+    return profiler
+
+def run_headless(robot, controller, steps):
+    """Runs up to steps simulation cycles as fast as possible, without drawing
+    or waiting for the clock: each one calls controller(robot) and then senses,
+    like a frame of robotica.main does. Returns the number of cycles it took to
+    reach the target, or None if it wasn't reached."""
+    for step in range(1, steps+1):
+        controller(robot)
+        robot.update()
+        if robot.target():
+            return step
+    return None
+
+def index_obstacles():
+    """Rebuilds the rect array and the grid index from list_rect_obstacles."""
+    global array_rect_obstacles, obstacle_grid
+    array_rect_obstacles = rects_to_array(list_rect_obstacles)
+    obstacle_grid = UniformGrid(array_rect_obstacles, display_cols, display_rows, grid_cell_size)
+    index_colors()
+
+def index_colors():
+    """Rebuilds array_palette_obstacles from list_obstacles."""
+    global array_palette_obstacles
+    array_palette_obstacles = np.array([palette_index(ob.color) for ob in list_obstacles], dtype=np.uint8)
+
+def palette_index(color):
+    """Returns the index of color in palette, appending it if it's new. The
+    sensors report colors as these indices, at most 256 of them."""
+    color = pygame.Color(color)
+    if color not in palette:
+        if len(palette) == 256:
+            raise ValueError('the palette is full, no room for %s' % (color,))
+        palette.append(color)
+    return palette.index(color)
+
+def _cell_spans(rects, resolution, inflate, shape):
+    """Returns the row0, row1, col0, col1 (exclusive) spans of the cells touched
+    by each rect grown by inflate pixels on every side, clipped to shape."""
+    rects = np.asarray(rects).reshape(-1,4)
+    rows = np.clip(np.stack([(rects[:,1]-inflate)//resolution, -((-rects[:,3]-inflate)//resolution)], axis=1), 0, shape[0])
+    cols = np.clip(np.stack([(rects[:,0]-inflate)//resolution, -((-rects[:,2]-inflate)//resolution)], axis=1), 0, shape[1])
+    return np.concatenate([rows, cols], axis=1).tolist()
+
+def _rasterize(grid, rects, resolution, inflate, region=None):
+    """Marks in grid the cells touched by rects, only inside region if given."""
+    if region is None:
+        region = (0, grid.shape[0], 0, grid.shape[1])
+    for row0, row1, col0, col1 in _cell_spans(rects, resolution, inflate, grid.shape):
+        grid[max(row0, region[0]):min(row1, region[1]), max(col0, region[2]):min(col1, region[3])] = 1
+
+def occupancy_grid(resolution=1, inflate=0):
+    """Returns the obstacles as a grid of 0 (free) and 1 (blocked) cells of
+    resolution x resolution pixels, indexed [row, col] like the mazes of
+    proff.astar. Each obstacle is grown by inflate pixels on every side, half
+    the robot size lets a planner treat the robot as a point.
+
+    Grids are cached per (resolution, inflate) and kept up to date by
+    add_obstacle and remove_obstacle; they must not be modified."""
+    key = (resolution, inflate)
+    if key not in occupancy_grids:
+        occupancy_grids[key] = _new_occupancy_grid(array_rect_obstacles, resolution, inflate)
+    return occupancy_grids[key]
+
+def _new_occupancy_grid(rects, resolution, inflate):
+    grid = np.zeros((-(-display_rows//resolution), -(-display_cols//resolution)), dtype=np.uint8)
+    _rasterize(grid, rects, resolution, inflate)
+    return grid
+
+def distance_field(resolution=1):
+    """Returns, for each cell of resolution x resolution pixels, the euclidean
+    distance from its nearest pixel to the nearest obstacle pixel, 0 for the
+    cells touching an obstacle, as a float32 grid indexed [row, col] like the
+    occupancy grids. Any pixel is at least its cell value from the obstacles.
+
+    Fields are cached per resolution; add_obstacle keeps them current and
+    remove_obstacle drops them. They must not be modified."""
+    if resolution not in distance_fields:
+        distance_fields[resolution] = _new_distance_field(array_rect_obstacles, resolution)
+    return distance_fields[resolution]
+
+def _new_distance_field(rects, resolution):
+    field = np.full((-(-display_rows//resolution), -(-display_cols//resolution)), np.inf, dtype=np.float32)
+    _merge_distances(field, rects, resolution)
+    return field
+
+def _merge_distances(field, rects, resolution):
+    """Lowers field to the distance from each cell to the rects where nearer."""
+    rects = np.asarray(rects).reshape(-1,4)
+    first_row = np.arange(field.shape[0])*resolution       #pixel span of each row and column of cells
+    first_col = np.arange(field.shape[1])*resolution
+    #gaps between the pixels of each cell and of each rect, on each axis
+    gap_y = np.maximum(np.maximum(rects[:,1,None] - (first_row + resolution-1), first_row - (rects[:,3,None]-1)), 0)
+    gap_x = np.maximum(np.maximum(rects[:,0,None] - (first_col + resolution-1), first_col - (rects[:,2,None]-1)), 0)
+    gap_y = gap_y.astype(np.float32)**2
+    gap_x = gap_x.astype(np.float32)**2
+    squared = np.full(field.shape, np.inf, dtype=np.float32)
+    for dy, dx in zip(gap_y, gap_x):
+        np.minimum(squared, dy[:,None] + dx, out=squared)
+    np.minimum(field, np.sqrt(squared), out=field)
+
+def clearance(x, y, resolution=1):
+    """Lower bound of the distance from pixel x, y to the nearest obstacle, read
+    from the distance field in constant time. 0 on an obstacle or off the field."""
+    field = distance_field(resolution)
+    row, col = pixel_to_cell(x, y, resolution)
+    if 0 <= row < field.shape[0] and 0 <= col < field.shape[1] and x >= 0 and y >= 0:
+        return float(field[row, col])
+    return 0.0
+
+def pixel_to_cell(x, y, resolution=1):
+    """Returns the (row, col) of the occupancy grid cell holding pixel x, y."""
+    return int(y)//resolution, int(x)//resolution
+
+def cell_to_pixel(row, col, resolution=1):
+    """Returns the x, y pixel at the center of an occupancy grid cell."""
+    return col*resolution + resolution//2, row*resolution + resolution//2
+
+def add_obstacle(obstacle):
+    """Adds an Obstacle to the world, drawing it into the cached occupancy grids."""
+    list_obstacles.append(obstacle)
+    list_rect_obstacles.append(pygame.Rect(obstacle.x_topleft,obstacle.y_topleft,obstacle.width,obstacle.height))
+    index_obstacles()
+    for (resolution, inflate), grid in occupancy_grids.items():
+        _rasterize(grid, array_rect_obstacles[-1], resolution, inflate)
+    for resolution, field in distance_fields.items():
+        _merge_distances(field, array_rect_obstacles[-1], resolution)
+
+def remove_obstacle(index):
+    """Removes list_obstacles[index] from the world. The cached occupancy grids
+    are only redrawn where the obstacle was."""
+    removed = array_rect_obstacles[index]
+    del list_obstacles[index], list_rect_obstacles[index]
+    index_obstacles()
+    distance_fields.clear()         #cells anywhere may have had it as nearest obstacle
+    for (resolution, inflate), grid in occupancy_grids.items():
+        region = _cell_spans(removed, resolution, inflate, grid.shape)[0]
+        grid[region[0]:region[1], region[2]:region[3]] = 0
+        #obstacles whose grown rect may touch the cells that were cleared
+        near = obstacle_grid.query_boxes(region[2]*resolution-inflate, region[0]*resolution-inflate,
+                                         region[3]*resolution+inflate-1, region[1]*resolution+inflate-1)
+        _rasterize(grid, array_rect_obstacles[near], resolution, inflate, region)
+
+def display_obstacles(target_surf=None):
+    s = target_surf or pygame.display.get_surface()
     for i in range(len(list_obstacles)):
-        s = pygame.display.get_surface()
         s.fill(list_obstacles[i].color, list_rect_obstacles[i])
 
 
+class Renderer():
+    """Draws the simulation on screen frame by frame, only updating what changed.
+
+    The obstacles are drawn once on a background surface, and so are the
+    traces as they appear. Each frame restores the background under the
+    previous rays and robot, draws the new ones and pushes only those
+    rectangles to the display."""
+
+    def __init__(self, screen, robot):
+        self.screen     = screen
+        self.robot      = robot
+        self.background = pygame.Surface(screen.get_size())
+        self.background.fill(pygame.Color(color_of_nothing))
+        display_obstacles(self.background)
+        self.sprites    = pygame.sprite.RenderUpdates((robot))
+        self.nr_traces  = 0             #traces already drawn on the background
+        screen.blit(self.background, (0,0))
+        self.ray_rects  = robot.draw_rays(screen)
+        self.sprites.draw(screen)
+        pygame.display.flip()
+
+    def draw(self):
+        with profiler.stage('restore'):
+            self.sprites.clear(self.screen, self.background)
+            dirty = list(self.ray_rects)
+            for rect in dirty:
+                self.screen.blit(self.background, rect, rect)
+        with profiler.stage('draw_traces'):
+            traces = self.robot.traces
+            new = min(traces.total - self.nr_traces, len(traces))
+            for center in traces.view()[len(traces)-new:].tolist():
+                rect = pygame.draw.circle(self.background, pygame.Color(trace_color), center, 2, 0)
+                self.screen.blit(self.background, rect, rect)
+                dirty.append(rect)
+            self.nr_traces = traces.total
+        with profiler.stage('draw_rays'):
+            self.ray_rects = self.robot.draw_rays(self.screen)
+        with profiler.stage('draw_sprites'):
+            dirty = dirty + self.ray_rects + self.sprites.draw(self.screen)
+        with profiler.stage('display_update'):
+            pygame.display.update(dirty)
+        profiler.count('dirty_rects', len(dirty))
+
+
 def ambiente1(list_obstacles):
         obs = Obstacle(display_cols/2,display_rows-200,10,200,wall_color)
         list_obstacles.append(obs)
@@ -0,0 +1,77 @@
+"""
+Uniform bucket grid over the obstacles of the 2D robot simulator
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import numpy as np
+
+
+class UniformGrid():
+    """Buckets the (N,4) left, top, right, bottom rects into square cells, so
+    that queries only look at the obstacles of the cells they touch.
+
+    Rects and queries outside width x height are clamped to the border
+    cells, which keeps every query conservative. buckets, the (start, items)
+    arrays of a grid built before over the same rects, skips the bucketing."""
+
+    def __init__(self, rects, width, height, cell_size, buckets=None):
+        self.rects      = rects
+        self.cell_size  = cell_size
+        self.nr_cols    = max(1, -(-int(width)//cell_size))
+        self.nr_rows    = max(1, -(-int(height)//cell_size))
+        if buckets is not None:
+            self.start, self.items = buckets
+            return
+        buckets = [[] for i in range(self.nr_cols*self.nr_rows)]
+        for i, (col0, row0, col1, row1) in enumerate(self._cells(rects[:,0], rects[:,1],
+                                                                 rects[:,2]-1, rects[:,3]-1).tolist()):
+            for row in range(row0, row1+1):
+                for col in range(col0, col1+1):
+                    buckets[row*self.nr_cols+col].append(i)
+        #compressed layout: the obstacles of cell c are items[start[c]:start[c+1]]
+        self.start = np.zeros(len(buckets)+1, dtype=int)
+        self.start[1:] = np.cumsum([len(b) for b in buckets])
+        self.items = np.array([i for b in buckets for i in b], dtype=int)
+
+    def _cells(self, left, top, right, bottom):
+        """Returns the (col0, row0, col1, row1) span of cells covering each box."""
+        cols = np.clip(np.floor_divide(np.stack([left, right], axis=-1), self.cell_size), 0, self.nr_cols-1)
+        rows = np.clip(np.floor_divide(np.stack([top, bottom], axis=-1), self.cell_size), 0, self.nr_rows-1)
+        return np.stack([cols[...,0], rows[...,0], cols[...,1], rows[...,1]], axis=-1).astype(int)
+
+    def query_boxes(self, left, top, right, bottom):
+        """Returns the sorted indices of the rects that may touch any of the boxes,
+        given by their inclusive left, top, right, bottom coordinates."""
+        boxes = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (left, top, right, bottom)))
+        spans = self._cells(*(v.ravel() for v in boxes))
+        cells = set()
+        for col0, row0, col1, row1 in spans.tolist():
+            for row in range(row0, row1+1):
+                cells.update(range(row*self.nr_cols+col0, row*self.nr_cols+col1+1))
+        if not cells:
+            return np.zeros(0, dtype=int)
+        return np.unique(np.concatenate([self.items[self.start[c]:self.start[c+1]] for c in cells]))
+
+    def query_rect(self, rect):
+        """Returns the sorted indices of the rects that may collide with rect."""
+        return self.query_boxes(rect.left, rect.top, rect.right-1, rect.bottom-1)
+
+    def query_segments(self, x0, y0, x1, y1):
+        """Returns the sorted indices of the rects that may be crossed by any of
+        the segments from (x0,y0) to (x1,y1), one pixel of slack included."""
+        x0, y0, x1, y1 = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (x0, y0, x1, y1)))
+        return self.query_boxes(np.minimum(x0, x1)-1, np.minimum(y0, y1)-1,
+                                np.maximum(x0, x1)+1, np.maximum(y0, y1)+1)
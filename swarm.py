@@ -0,0 +1,169 @@
+"""
+Many robots of the 2D robot simulator moving in lockstep
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import numpy as np
+import simulation
+import pygame
+
+chunk_size = 64     #robots handled together, so that rays x nearby obstacles stays small
+
+
+class Swarm():
+    """K copies of a Robot, as returned by init_simulation, whose state lives in
+    arrays so that every operation applies to all of them (or to a boolean
+    mask of them) at once, against the obstacles of the current simulation.
+
+    Moves, spins, collisions and sensing follow the Robot methods, except
+    that spin and move_fwd don't sense first: the retina is refreshed by
+    sense, or by step, which senses last like a frame of robotica.main."""
+
+    def __init__(self, robot, nr_robots):
+        self.size           = np.array(robot.rect.size)
+        self.topleft        = np.tile(np.array(robot.rect.topleft), (nr_robots,1))
+        self.azi            = np.full(nr_robots, robot.azi, dtype=float)     #in degrees
+        self.fwd_speed      = np.full(nr_robots, robot.fwd_speed, dtype=float)
+        self.spin_speed     = np.full(nr_robots, robot.spin_speed, dtype=float)
+        self.collided       = np.zeros(nr_robots, dtype=bool)
+        self.visual_range   = robot.visual_range
+        self.visual_angle   = robot.visual_angle
+        self.nr_sensors     = int(robot.nr_sensors)
+        n = (self.nr_sensors - 1)//2
+        self.sensor_offsets = -np.arange(-n, n+1)*self.visual_angle
+        #distance sensed by each sensor and index of the obstacle seen, -1 for none
+        self.retina         = np.full((nr_robots, self.nr_sensors), self.visual_range, dtype=int)
+        self.retina_hits    = np.full((nr_robots, self.nr_sensors), -1, dtype=int)
+        self.steps          = 0
+        self.reached_at     = np.full(nr_robots, -1)     #step at which each robot reached the target
+
+    def __len__(self):
+        return len(self.azi)
+
+    def _mask(self, which):
+        return np.ones(len(self), dtype=bool) if which is None else np.asarray(which, dtype=bool)
+
+    def _chunks(self, centers):
+        """Splits the robots in chunks of neighbours, sorted by grid cell."""
+        cell = simulation.obstacle_grid.cell_size
+        order = np.lexsort((centers[:,0]//cell, centers[:,1]//cell))
+        return [order[i:i+chunk_size] for i in range(0, len(order), chunk_size)]
+
+    def get_pos(self):
+        return self.topleft + self.size//2
+
+    def spin(self, dtheta, which=None):
+        which = self._mask(which)
+        self.collided[which] = False
+        azi = self.azi + np.broadcast_to(np.asarray(dtheta, dtype=float), self.azi.shape)
+        azi = np.where(azi >= 360, azi-360, azi)     #keep theta between -360..360
+        azi = np.where(azi <= -360, azi+360, azi)
+        self.azi = np.where(which, azi, self.azi)
+
+    def move_fwd(self, which=None):
+        which = self._mask(which)
+        self.collided[which] = False
+        temp_unghi = self.azi*np.pi/180
+        walk = np.stack([-self.fwd_speed*np.sin(temp_unghi), -self.fwd_speed*np.cos(temp_unghi)], axis=1)
+        self.move(walk, which)
+
+    def move(self, delta, which=None):
+        """Moves by delta as Robot.move, up to the first obstacle in the way or,
+        without r_swept_collision, undoing the moves that end up colliding."""
+        which = self._mask(which)
+        step = np.broadcast_to(np.trunc(delta).astype(int), self.topleft.shape)    #Rect.move truncates
+        moved = self.topleft + step
+        collision = np.zeros(len(self), dtype=bool)
+        rects = simulation.array_rect_obstacles
+        grid = simulation.obstacle_grid
+        for chunk in self._chunks(moved):
+            chunk = chunk[which[chunk]]
+            if len(chunk) == 0:
+                continue
+            start, end = self.topleft[chunk], moved[chunk]
+            low, high = np.minimum(start, end), np.maximum(start, end) + self.size
+            near = grid.query_boxes(low[:,0], low[:,1], high[:,0]-1, high[:,1]-1)
+            if len(near) == 0:
+                continue
+            ob = rects[near]
+            if simulation.r_swept_collision:
+                toi, hit = simulation.sweep_boxes(np.concatenate([start, start + self.size], axis=1),
+                                                  step[chunk], ob)
+                collision[chunk] = hit != -1
+                contact = start + simulation.contact_offsets(step[chunk], toi)
+                #as swept_move, stay put when the contact rounded to pixels clips a corner
+                moved[chunk] = np.where(self._overlapping(contact, ob)[:,None], start, contact)
+            else:
+                collision[chunk] = self._overlapping(end, ob)
+                moved[chunk] = np.where(collision[chunk][:,None], start, end)
+        self.collided |= which & collision
+        self.topleft = np.where(which[:,None], moved, self.topleft)
+
+    def _overlapping(self, topleft, rects):
+        """Which robots placed at topleft overlap any of the rects."""
+        left, top = topleft[:,0,None], topleft[:,1,None]
+        right, bottom = left + self.size[0], top + self.size[1]
+        return ((left < rects[:,2]) & (rects[:,0] < right) &
+                (top < rects[:,3]) & (rects[:,1] < bottom)).any(axis=1)
+
+    def sense(self):
+        """Places in self.retina the range sensed by each sensor of each robot."""
+        granu = simulation.r_visual_granularity
+        reach = len(range(granu, self.visual_range+granu, granu))*granu
+        rects = simulation.array_rect_obstacles
+        grid = simulation.obstacle_grid
+        centers = self.get_pos()
+        angs = (self.azi[:,None] + self.sensor_offsets)*np.pi/180
+        sins, coss = np.sin(angs), np.cos(angs)
+        for chunk in self._chunks(centers):
+            x, y = centers[chunk,0,None], centers[chunk,1,None]
+            near = grid.query_segments(x, y, x - reach*sins[chunk], y - reach*coss[chunk])
+            distances, hits = simulation.cast_rays(x, y, sins[chunk], coss[chunk], rects[near],
+                                                   self.visual_range, granu)
+            hit = hits != -1
+            hits[hit] = near[hits[hit]]     #back to indices in the whole obstacle list
+            self.retina[chunk] = distances
+            self.retina_hits[chunk] = hits
+        return self.retina
+
+    def retina_colors(self, k):
+        """Returns the colors seen by the sensors of robot k, as in Robot.retina."""
+        nothing = pygame.Color(simulation.color_of_nothing)
+        return [simulation.list_obstacles[i].color if i != -1 else nothing
+                for i in self.retina_hits[k].tolist()]
+
+    def retina_palette(self):
+        """Returns the palette indices (see simulation.palette_index) of the colors
+        seen by every sensor of every robot."""
+        return np.where(self.retina_hits != -1, simulation.array_palette_obstacles[self.retina_hits], 0)
+
+    def target(self):
+        centers = self.get_pos()
+        return (centers[:,0] >= 1120) & (centers[:,1] <= 68)
+
+    def step(self, forward=None, spin=None):
+        """One simulation cycle: spins the robots with a non zero spin (degrees per
+        robot, or None), then moves forward the robots in the forward mask (None
+        for none), then senses."""
+        if spin is not None:
+            spin = np.broadcast_to(np.asarray(spin, dtype=float), self.azi.shape)
+            self.spin(spin, spin != 0)
+        if forward is not None:
+            self.move_fwd(forward)
+        self.sense()
+        self.steps += 1
+        self.reached_at[(self.reached_at == -1) & self.target()] = self.steps
+        return self.retina
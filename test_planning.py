@@ -0,0 +1,46 @@
+"""
+Checks of the incremental Planner against plain searches
+
+    python -m pytest -q
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+from planning import Planner
+from test_proff import bfs_length, random_cell, random_maze
+
+
+def test_planner_matches_bfs_under_edits():
+    rng = np.random.default_rng(0)
+    for _ in range(40):
+        maze = random_maze(rng, 30, 0.4)
+        planner = Planner(maze)
+        start, goal = random_cell(rng, maze), random_cell(rng, maze)
+        for _ in range(15):
+            if rng.random() < 0.5:
+                for row, col in rng.integers(0, maze.shape, (int(rng.integers(1, 5)), 2)):
+                    maze[row, col] ^= 1
+                planner.update(maze)
+            path = planner.plan(start, goal)
+            expected = bfs_length(maze, start, goal)
+            assert (None if path is None else len(path)) == expected
+            if path is not None:
+                assert path[0] == start and path[-1] == goal
+                assert all(not maze[cell] for cell in path)
+            if path is not None and len(path) > 2:
+                start = path[1]     #the robot moves along the path
+            else:
+                start = random_cell(rng, maze)
@@ -0,0 +1,188 @@
+"""
+Checks of the path searches of proff against plain searches
+
+    python -m pytest -q
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from collections import deque
+from fractions import Fraction
+import heapq
+import math
+
+import numpy as np
+import pytest
+
+import proff
+
+
+def bfs_length(maze, start, end):
+    """Cells of the shortest 8-connected path, None if there is none."""
+    rows, cols = maze.shape
+    if maze[start] or maze[end]:
+        return None
+    seen = {start: 1}
+    queue = deque([start])
+    while queue:
+        cell = queue.popleft()
+        if cell == end:
+            return seen[cell]
+        for d_row, d_col in proff.neighbours:
+            other = (cell[0] + d_row, cell[1] + d_col)
+            if 0 <= other[0] < rows and 0 <= other[1] < cols and not maze[other] and other not in seen:
+                seen[other] = seen[cell] + 1
+                queue.append(other)
+    return None
+
+
+def octile_dijkstra(maze, start, end):
+    """Cost of the shortest 8-connected path, diagonals costing sqrt(2)."""
+    rows, cols = maze.shape
+    cost = {start: 0.0}
+    queue = [(0.0, start)]
+    done = set()
+    while queue:
+        c, cell = heapq.heappop(queue)
+        if cell in done:
+            continue
+        if cell == end:
+            return c
+        done.add(cell)
+        for d_row, d_col in proff.neighbours:
+            other = (cell[0] + d_row, cell[1] + d_col)
+            if 0 <= other[0] < rows and 0 <= other[1] < cols and not maze[other]:
+                new = c + (math.sqrt(2) if d_row and d_col else 1)
+                if new < cost.get(other, math.inf) - 1e-12:
+                    cost[other] = new
+                    heapq.heappush(queue, (new, other))
+    return None
+
+
+def visible(maze, start, end):
+    """line_of_sight done by hand: every cell but start whose inside the
+    segment between the centers of start and end crosses is free, and where
+    it goes through a corner, the two cells beside it are free."""
+    (row, col), (end_row, end_col) = start, end
+    d_row, d_col = end_row - row, end_col - col
+    for r in range(min(row, end_row), max(row, end_row)+1):
+        for c in range(min(col, end_col), max(col, end_col)+1):
+            low, high = Fraction(0), Fraction(1)
+            for origin, step, center in ((row, d_row, r), (col, d_col, c)):
+                if step == 0:
+                    low, high = (low, high) if origin == center else (1, 0)
+                else:
+                    enter, leave = sorted(((center - origin - Fraction(1, 2))/step, (center - origin + Fraction(1, 2))/step))
+                    low, high = max(low, enter), min(high, leave)
+            if low < high and maze[r, c] and (r, c) != (row, col):
+                return False
+    for k in range(min(row, end_row), max(row, end_row)):
+        if d_row and d_col:
+            t = (k - row + Fraction(1, 2))/d_row
+            corner_col = col + t*d_col - Fraction(1, 2)
+            if 0 < t < 1 and corner_col.denominator == 1:
+                m = int(corner_col)
+                beside = [(k, m+1), (k+1, m)] if d_row*d_col > 0 else [(k, m), (k+1, m+1)]
+                if any(maze[cell] for cell in beside):
+                    return False
+    return True
+
+
+def random_maze(rng, max_side=25, max_density=0.45):
+    rows, cols = rng.integers(1, max_side, 2)
+    return (rng.random((rows, cols)) < rng.random()*max_density).astype(np.uint8)
+
+
+def random_cell(rng, maze):
+    return int(rng.integers(maze.shape[0])), int(rng.integers(maze.shape[1]))
+
+
+def test_wavefront_matches_bfs():
+    rng = np.random.default_rng(2)
+    for _ in range(40):
+        maze = random_maze(rng)
+        starts, ends = proff.path_star(maze), proff.path_end(maze)
+        lengths = proff.path_lengths(maze, starts, ends)
+        for i, start in enumerate(starts):
+            for j, end in enumerate(ends):
+                expected = bfs_length(maze, tuple(start), tuple(end))
+                assert lengths[i, j] == (-1 if expected is None else expected)
+
+
+def test_parallel_tortusity_matches_serial():
+    rng = np.random.default_rng(3)
+    maze = (rng.random((150, 90)) < 0.3).astype(np.uint8)     #more than 64 inlets, several chunks
+    assert len(proff.path_star(maze)) > 64
+    assert proff.tortusity(maze, workers=3) == proff.tortusity(maze)
+
+
+def test_jump_point_search_matches_octile_dijkstra():
+    rng = np.random.default_rng(5)
+    for _ in range(200):
+        maze = random_maze(rng)
+        start, end = random_cell(rng, maze), random_cell(rng, maze)
+        maze[start] = 0
+        expected = octile_dijkstra(maze, start, end)
+        path = proff.astar(maze, np.array(start), np.array(end), backend='jps')
+        if expected is None:
+            assert path is None
+            continue
+        assert path[0] == start and path[-1] == end
+        cost = 0
+        for a, b in zip(path, path[1:]):
+            assert max(abs(a[0] - b[0]), abs(a[1] - b[1])) == 1 and not maze[b]
+            cost += math.sqrt(2) if a[0] != b[0] and a[1] != b[1] else 1
+        assert cost == pytest.approx(expected)
+
+
+def test_line_of_sight_matches_segment_crossing():
+    rng = np.random.default_rng(6)
+    for _ in range(100):
+        maze = random_maze(rng, 15)
+        for _ in range(20):
+            start, end = random_cell(rng, maze), random_cell(rng, maze)
+            assert proff.line_of_sight(maze, np.array(start), np.array(end)) == visible(maze, start, end)
+
+
+def test_theta_star_paths_are_valid_and_short():
+    rng = np.random.default_rng(8)
+    for _ in range(200):
+        maze = random_maze(rng)
+        start, end = random_cell(rng, maze), random_cell(rng, maze)
+        maze[start] = 0
+        expected = octile_dijkstra(maze, start, end)
+        path = proff.astar(maze, np.array(start), np.array(end), backend='theta')
+        if expected is None:
+            assert path is None
+            continue
+        assert path[0] == start and path[-1] == end
+        for a, b in zip(path, path[1:]):
+            #each leg is a step of the grid or a straight line through free cells
+            assert not maze[b]
+            assert max(abs(a[0] - b[0]), abs(a[1] - b[1])) == 1 or visible(maze, a, b)
+        #any angle paths are never longer than the grid ones
+        assert sum(math.dist(a, b) for a, b in zip(path, path[1:])) <= expected + 1e-9
+
+
+@pytest.mark.parametrize('packed', [False, True])
+def test_stack_tortusity_matches_slices(packed, tmp_path):
+    rng = np.random.default_rng(4)
+    slices = (rng.random((5, 30, 21)) < 0.3).astype(np.uint8)    #21 columns, not a whole number of bytes
+    path = str(tmp_path / 'stack.raw')
+    shape = proff.save_stack(iter(slices), path, packed)
+    assert shape == slices.shape
+    stack = proff.open_stack(path, shape, packed)
+    assert np.array_equal(np.array([stack[k] for k in range(len(stack))]), slices)
+    expected = [proff.tortusity(image) for image in slices]
+    assert list(proff.tortusity_slices(stack)) == expected
@@ -0,0 +1,110 @@
+"""
+Checks of the server sessions against robots driven directly
+
+    python -m pytest -q
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import asyncio
+import math
+
+import numpy as np
+import pytest
+
+import server
+import simulation
+
+
+def pack(command):
+    return server.COMMAND.pack(*(command + (0, 0))[:3])
+
+
+def batch(*commands):
+    return b''.join([b'B', server.COUNT.pack(len(commands))] + [pack(command) for command in commands])
+
+
+def frames(answer):
+    assert answer[:1] == b'O'
+    target, nr_frames, size = server.FRAMES.unpack_from(answer, 1)
+    return np.frombuffer(answer, dtype='<f4', offset=1+server.FRAMES.size).reshape(nr_frames, size)
+
+
+def test_server_sessions_match_robots():
+    rng = np.random.default_rng(0)
+    worlds = [(20, 0, 3), (20, 1, 4), (20, 0, 5)]
+    sessions = [server.Session() for _ in worlds]
+    got = [list(frames(s.handle(b'R' + server.RESET.pack(*w)))) for s, w in zip(sessions, worlds)]
+    scripts = [[((server.MOVE_FWD,), (server.SENSE,)) if rng.random() < 0.7 else
+                ((server.SPIN, float(rng.choice([-45, 30]))), (server.MOVE, 3.7, -2.2), (server.SENSE,))
+                for _ in range(30)] for _ in sessions]
+    for step in range(30):          #the sessions take turns, as they do on the server
+        for k, session in enumerate(sessions):
+            got[k] += list(frames(session.handle(batch(*scripts[k][step]))))
+    session = sessions[0]
+    before = session.robot.get_pos(), session.robot.azi
+    for commands in [((server.MOVE, math.nan, 0),), ((server.SPIN, math.inf), (server.SENSE,)),
+                     ((server.MOVE, 1e30, 0),), ((9,),)]:
+        with pytest.raises(server.ProtocolError):
+            session.handle(batch(*commands))
+    assert (session.robot.get_pos(), session.robot.azi) == before
+    server.active_world = None      #the robots below replace the world of the simulation
+    for k, world in enumerate(worlds):
+        robot = simulation.init_simulation(headless=True, world=simulation.generate_world(*world))
+        robot.sense()
+        expected = [robot.observe()]
+        for commands in scripts[k]:
+            for command in commands:
+                code, a, b = server.COMMAND.unpack(pack(command))   #the float32 arguments the server gets
+                if code == server.MOVE_FWD:
+                    robot.move_fwd()
+                elif code == server.SPIN:
+                    robot.spin(a)
+                elif code == server.MOVE:
+                    robot.move(a, b)
+                else:
+                    robot.sense()
+                    expected.append(robot.observe())
+        assert np.array_equal(np.array(got[k]), np.array(expected, dtype='<f4'))
+
+
+def test_connections_survive_errors(tmp_path, monkeypatch):
+    failures = [RuntimeError('broken')]
+    run = server.Session.run
+
+    def run_once_broken(self, payload):
+        if failures:
+            raise failures.pop()
+        return run(self, payload)
+    monkeypatch.setattr(server.Session, 'run', run_once_broken)
+
+    async def talk():
+        path = str(tmp_path / 'robots.sock')
+        listener = await asyncio.start_unix_server(server.handle_connection, path)
+        reader, writer = await asyncio.open_unix_connection(path)
+        answers = []
+        for body in (b'X', b'R' + server.RESET.pack(10, 0, 1), batch((server.SENSE,)), batch((server.SENSE,))):
+            writer.write(server.HEADER.pack(len(body)) + body)
+            length, = server.HEADER.unpack(await reader.readexactly(server.HEADER.size))
+            answers.append(await reader.readexactly(length))
+        writer.close()
+        listener.close()
+        await listener.wait_closed()
+        return answers
+    answers = asyncio.run(talk())
+    assert [answer[:1] for answer in answers] == [b'E', b'O', b'E', b'O']
+    assert b'RuntimeError' in answers[2]
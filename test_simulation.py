@@ -0,0 +1,199 @@
+"""
+Checks of the simulation engines against the simple code they replace
+
+    python -m pytest -q
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import math
+
+import numpy as np
+import pygame
+import pytest
+
+import simulation
+
+
+def march(robot):
+    """The sensing loop cast_rays replaced: every ray stepped granu pixels at a
+    time, each point tested against every obstacle. Returns the distances and
+    the colors seen."""
+    n = int((robot.nr_sensors - 1)/2)
+    granu = simulation.r_visual_granularity
+    distances, colors = [], []
+    for i in range(-n, n+1):
+        ang = (robot.azi - i*robot.visual_angle)*math.pi/180
+        for distance in range(granu, robot.visual_range+granu, granu):
+            x = robot.rect.center[0] - distance*math.sin(ang)
+            y = robot.rect.center[1] - distance*math.cos(ang)
+            count = next((k for k, ob in enumerate(simulation.list_rect_obstacles) if ob.collidepoint(x, y)), -1)
+            if count != -1:
+                break
+        distances.append(distance)
+        colors.append(tuple(simulation.list_obstacles[count].color if count != -1
+                            else pygame.Color(simulation.color_of_nothing)))
+    return distances, colors
+
+
+@pytest.mark.parametrize('engine', ['slab', 'sphere'])
+def test_rays_match_marching(engine, monkeypatch):
+    monkeypatch.setattr(simulation, 'ray_engine', engine)
+    rng = np.random.default_rng(1)
+    for seed, ambiente in ((1, 0), (2, 1), (3, 2)):
+        robot = simulation.init_simulation(60, ambiente, headless=True, seed=seed)
+        for _ in range(60):
+            robot.rect.center = int(rng.integers(-10, 1210)), int(rng.integers(-10, 710))
+            robot.azi = float(rng.choice([rng.uniform(-360, 360), 0, 90, 180, 22.5]))
+            distances = robot.sense()
+            assert (distances, [tuple(color) for _, color in robot.retina]) == march(robot)
+
+
+@pytest.mark.parametrize('capacity', [None, 1, 5, 300])
+def test_trace_buffer_keeps_the_last_points(capacity):
+    rng = np.random.default_rng(capacity)
+    points = [tuple(p) for p in rng.integers(0, 4, (700, 2)).tolist()]
+    traces = simulation.TraceBuffer(capacity)
+    kept = []
+    for point in points:
+        traces.append(*point)
+        if not kept or kept[-1] != point:   #decimation drops repeats of the last point
+            kept.append(point)
+    expected = kept if capacity is None else kept[-capacity:]
+    assert [tuple(p) for p in traces.view().tolist()] == expected
+    assert traces.total == len(kept) and len(traces) == len(expected)
+    assert not traces.view().flags.writeable
+    everything = simulation.TraceBuffer(capacity, decimate=False)
+    for point in points:
+        everything.append(*point)
+    assert [tuple(p) for p in everything.view().tolist()] == (points if capacity is None else points[-capacity:])
+
+
+def test_trace_buffer_rejects_capacity_below_one():
+    with pytest.raises(ValueError):
+        simulation.TraceBuffer(0)
+
+
+def test_occupancy_grids_follow_added_and_removed_obstacles():
+    simulation.init_simulation(60, headless=True, seed=7)
+    keys = [(1, 0), (4, 0), (4, 20), (7, 3)]
+    for key in keys:
+        simulation.occupancy_grid(*key)
+    rng = np.random.default_rng(7)
+    for _ in range(30):
+        if rng.random() < 0.5 and simulation.list_obstacles:
+            simulation.remove_obstacle(int(rng.integers(len(simulation.list_obstacles))))
+        else:
+            x, y = int(rng.integers(0, 1150)), int(rng.integers(0, 650))
+            simulation.add_obstacle(simulation.Obstacle(x, y, int(rng.integers(1, 80)), int(rng.integers(1, 80)), 'black'))
+        #the grids repainted in place equal grids drawn from scratch
+        for key in keys:
+            assert np.array_equal(simulation.occupancy_grid(*key),
+                                  simulation._new_occupancy_grid(simulation.array_rect_obstacles, *key))
+
+
+def same_world(a, b):
+    return (np.array_equal(a.array, b.array) and
+            [tuple(ob.color) for ob in a.obstacles] == [tuple(ob.color) for ob in b.obstacles] and
+            (a.seed, a.ambiente, a.nr_obstacles) == (b.seed, b.ambiente, b.nr_obstacles) and
+            np.array_equal(a.grid.start, b.grid.start) and np.array_equal(a.grid.items, b.grid.items))
+
+
+def test_worlds_round_trip_through_the_cache(tmp_path, monkeypatch):
+    world = simulation.generate_world(20, 0, 5)
+    assert same_world(world, simulation.generate_world(20, 0, 5))
+    world.occupancy_grid(4, 10)
+    world.distance_field(8)
+    world.save(str(tmp_path / 'world.npz'))
+    loaded = simulation.load_world(str(tmp_path / 'world.npz'))
+    assert same_world(loaded, world)
+    assert np.array_equal(loaded.occupancy_grids[4, 10], world.occupancy_grid(4, 10))
+    assert np.array_equal(loaded.distance_fields[8], world.distance_field(8))
+
+    cached = simulation.cached_world(20, 0, 5, cache_dir=str(tmp_path))
+    assert same_world(cached, world)
+    assert same_world(simulation.cached_world(20, 0, 5, cache_dir=str(tmp_path)), world)
+    assert simulation.cached_world(20, 0, None, cache_dir=str(tmp_path / 'unseeded')).seed is None
+    assert not (tmp_path / 'unseeded').exists()
+
+    #worlds saved with other settings are not loaded, the cache builds them again
+    monkeypatch.setattr(simulation, 'grid_cell_size', 40)
+    with pytest.raises(ValueError):
+        simulation.load_world(str(tmp_path / 'world.npz'))
+    rebuilt = simulation.cached_world(20, 0, 5, cache_dir=str(tmp_path))
+    assert np.array_equal(rebuilt.array, world.array) and rebuilt.grid.cell_size == 40
+
+
+def test_swept_move_stops_at_obstacles():
+    simulation.init_simulation(80, headless=True, seed=11)
+    obstacles = simulation.array_rect_obstacles
+    rng = np.random.default_rng(3)
+    for _ in range(2000):
+        rect = pygame.Rect(int(rng.integers(0, 1160)), int(rng.integers(0, 660)),
+                           int(rng.integers(5, 45)), int(rng.integers(5, 45)))
+        if simulation.colliding_obstacle(rect) != -1:
+            continue
+        dx, dy = rng.uniform(-80, 80, 2)
+        moved, hit = simulation.swept_move(rect, dx, dy)
+        assert simulation.colliding_obstacle(moved) == -1
+        if hit == -1:
+            assert moved.topleft == (rect.x + int(dx), rect.y + int(dy))
+        #no obstacle anywhere between the start and where the rect stopped
+        for t in np.linspace(0, 1, 50):
+            x, y = rect.x + t*(moved.x - rect.x), rect.y + t*(moved.y - rect.y)
+            assert not ((x < obstacles[:,2]) & (obstacles[:,0] < x + rect.w) &
+                        (y < obstacles[:,3]) & (obstacles[:,1] < y + rect.h)).any()
+    #a thin wall the old move jumped over
+    simulation.init_simulation(0, headless=True, seed=0)
+    simulation.add_obstacle(simulation.Obstacle(300, 0, 5, 700, 'black'))
+    moved, hit = simulation.swept_move(pygame.Rect(240, 300, 40, 40), 80, 0)
+    assert hit == len(simulation.list_obstacles) - 1 and moved.right == 300
+
+
+def wander(robot):
+    if robot.get_collision():
+        robot.spin(45)
+    robot.move_fwd()
+
+
+def test_observations_match_the_robot_and_run_headless():
+    robot = simulation.init_simulation(30, headless=True, seed=2)
+    robot.sense()
+    observation = robot.observe()
+    n = len(robot.retina)
+    assert observation.shape == (robot.observation_size,) == (4 + 2*n,)
+    assert tuple(observation[:2]) == robot.get_pos() and observation[2] == robot.azi
+    assert observation[3] == robot.collided
+    assert observation[4:4+n].tolist() == robot.printRetina()
+    assert [simulation.palette[int(i)] for i in observation[4+n:]] == [color for _, color in robot.retina]
+    out = np.zeros((2, robot.observation_size), dtype=np.float32)
+    row = out[1]
+    assert robot.observe(row) is row and np.array_equal(out[1], observation.astype(np.float32))
+
+    #run_steps takes the same cycles as run_headless, observing after each
+    first = simulation.init_simulation(30, headless=True, seed=2)
+    second = simulation.Robot(first.image, *first.rect.topleft, first.azi, first.fwd_speed,
+                              first.spin_speed, first.visual_range, first.visual_angle)
+    second.render = False
+    out = np.full((200, first.observation_size), np.nan)
+    filled = first.run_steps(wander, out)
+    for step in range(filled):
+        wander(second)
+        second.update()
+        assert np.array_equal(out[step], second.observe())
+    assert filled == 200 or first.target()
+    assert np.isnan(out[filled:]).all()
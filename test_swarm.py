@@ -0,0 +1,53 @@
+"""
+Checks of the Swarm against robots simulated one by one
+
+    python -m pytest -q
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy as np
+
+import simulation
+import swarm
+
+
+def test_swarm_matches_robots():
+    robot = simulation.init_simulation(60, headless=True, seed=4)
+    nr_robots = 10
+    robots = [simulation.Robot(robot.image, *robot.rect.topleft, robot.azi, robot.fwd_speed,
+                               robot.spin_speed, robot.visual_range, robot.visual_angle)
+              for _ in range(nr_robots)]
+    for r in robots:
+        r.render = False
+    group = swarm.Swarm(robot, nr_robots)
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        fwd = rng.random(nr_robots) < 0.7
+        spin = np.where(fwd, 0, rng.choice([-45, -7.5, 3, 30], nr_robots))
+        for k, r in enumerate(robots):
+            if spin[k]:
+                r.spin(spin[k])
+            if fwd[k]:
+                r.move_fwd()
+            r.sense()
+        group.step(fwd, spin)
+        for k, r in enumerate(robots):
+            assert tuple(group.get_pos()[k]) == r.get_pos()
+            assert group.azi[k] == r.azi and group.collided[k] == r.collided
+            assert list(group.retina[k]) == r.printRetina()
+            assert [tuple(c) for c in group.retina_colors(k)] == [tuple(c) for _, c in r.retina]